@@ -22,6 +22,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'discord.discord.settings') # Co
 django.setup()
 
 from invitation_roles.models import Invite, AccessRole, BotConfiguration, HotmartSubscription, SharedInviteLink, SharedInviteRedemption
+from invitation_roles.config_registry import config_registry
 from chatbot_ai.discord_commands import setup as setup_chatbot
 
 # --- Helper Functions ---
@@ -31,25 +32,13 @@ async def get_bot_config(name, default=None):
     Obtiene una configuración del bot desde la base de datos.
     Si no existe o no está activa, devuelve el valor por defecto.
     """
-    try:
-        config = await sync_to_async(
-            lambda: BotConfiguration.objects.filter(name=name, is_active=True).first()
-        )()
-        return config.value if config else default
-    except Exception as e:
-        print(f"Error al obtener configuración '{name}': {e}")
-        return default
+    return await config_registry.aget(name, default)
 
 async def get_bot_config_int(name, default=None):
     """
     Obtiene una configuración del bot como entero.
     """
-    value = await get_bot_config(name, default)
-    try:
-        return int(value) if value else default
-    except (ValueError, TypeError):
-        print(f"Error al convertir configuración '{name}' a entero: {value}")
-        return default
+    return await config_registry.aget_int(name, default)
 
 async def update_bot_config(name, value, description=None):
     """
@@ -314,6 +303,8 @@ discord_api_semaphore = asyncio.Semaphore(3)  # Máximo 3 llamadas simultáneas
 @bot.event
 async def on_ready():
     print(f'Bot listo como {bot.user}!')
+    # Las configuraciones se leen de memoria; el trigger de BotConfiguration avisa de cambios
+    config_registry.start_listener()
     await populate_guild_invites()
     
     # Configurar chatbot
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.contrib import admin
+from .answer_cache import invalidate_answer_cache
 from .models import (
     ChatbotConfiguration, ChatbotRole, ChatbotSession, 
-    ChatbotMessage, ChatbotUsage, ChatbotTraining, ChatbotKnowledgeChunk
+    ChatbotMessage, ChatbotUsage, ChatbotTraining, ChatbotKnowledgeChunk,
+    ChatbotKnowledgeSource, ChatbotEmbeddingCache, ChatbotAnswerCache, ChatbotCacheGeneration
 )
 
 @admin.register(ChatbotConfiguration)
@@ -13,7 +16,7 @@ class ChatbotConfigurationAdmin(admin.ModelAdmin):
 
 @admin.register(ChatbotRole)
 class ChatbotRoleAdmin(admin.ModelAdmin):
-    list_display = ['role_name', 'role_id', 'daily_limit', 'monthly_limit', 'priority', 'is_active']
+    list_display = ['role_name', 'role_id', 'daily_limit', 'monthly_limit', 'allowed_courses', 'priority', 'is_active']
     list_filter = ['is_active', 'priority']
     search_fields = ['role_name', 'role_id']
     ordering = ['-priority', 'role_name']
@@ -52,5 +55,55 @@ class ChatbotKnowledgeChunkAdmin(admin.ModelAdmin):
     list_display = ['source_file', 'course', 'module', 'chunk_index', 'token_count', 'created_at']
     list_filter = ['course', 'created_at']
     search_fields = ['content', 'source_file', 'module']
-    readonly_fields = ['created_at', 'updated_at', 'token_count']
-    ordering = ['course', 'source_file', 'chunk_index']
\ No newline at end of file
+    readonly_fields = ['created_at', 'updated_at', 'token_count', 'content_hash', 'simhash', 'duplicate_sources']
+    ordering = ['course', 'source_file', 'chunk_index']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self._knowledge_changed()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self._knowledge_changed()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self._knowledge_changed()
+
+    def _knowledge_changed(self):
+        invalidate_answer_cache()
+        if settings.CHATBOT_RAG_BACKEND == 'memory':
+            from .memory_index import memory_index
+            memory_index.request_rebuild()
+
+
+@admin.register(ChatbotKnowledgeSource)
+class ChatbotKnowledgeSourceAdmin(admin.ModelAdmin):
+    list_display = ['source_file', 'course', 'chunk_count', 'indexed_at']
+    list_filter = ['course']
+    search_fields = ['source_file']
+    readonly_fields = ['content_hash', 'chunk_count', 'indexed_at']
+
+
+@admin.register(ChatbotEmbeddingCache)
+class ChatbotEmbeddingCacheAdmin(admin.ModelAdmin):
+    list_display = ['cache_key', 'embedding_model', 'dimensions', 'hit_count', 'last_used_at', 'created_at']
+    list_filter = ['embedding_model', 'dimensions']
+    search_fields = ['cache_key']
+    readonly_fields = ['created_at', 'last_used_at', 'hit_count']
+    exclude = ['embedding']
+
+
+
+@admin.register(ChatbotAnswerCache)
+class ChatbotAnswerCacheAdmin(admin.ModelAdmin):
+    list_display = ['question', 'tokens_used', 'hit_count', 'created_at']
+    search_fields = ['question', 'answer']
+    readonly_fields = ['created_at', 'hit_count']
+    exclude = ['query_embedding']
+
+
+@admin.register(ChatbotCacheGeneration)
+class ChatbotCacheGenerationAdmin(admin.ModelAdmin):
+    list_display = ['name', 'generation', 'updated_at']
+    readonly_fields = ['generation', 'updated_at']
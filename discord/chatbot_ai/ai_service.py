@@ -1,11 +1,24 @@
 import os
+import json
+import hashlib
 import asyncio
 import aiohttp
 import time
-from typing import List, Dict, Tuple
-from asgiref.sync import sync_to_async
-from .models import ChatbotSession, ChatbotMessage, ChatbotConfiguration, ChatbotTraining
+from typing import List, Dict, Tuple, Callable, Awaitable
+from django.conf import settings
+from .models import ChatbotSession, ChatbotMessage
+from .db_reads import db_read
 from .vector_service import vector_service
+from .http_client import openai_http, openai_url
+from .answer_cache import answer_cache
+from .embedding_cache import embedding_cache
+from .single_flight import single_flight
+from .prompt_registry import prompt_registry
+from .role_registry import role_registry
+
+
+class AIServiceError(Exception):
+    """No se pudo generar la respuesta; el mensaje ya está listo para mostrarse al usuario"""
 
 
 class AIService:
@@ -25,9 +38,7 @@ class AIService:
     async def get_system_prompt(self, user_query: str | None = None) -> str:
         """Obtiene el prompt del sistema con contexto RAG relevante"""
         try:
-            base_prompt = await self._get_config_value('system_prompt', self._get_default_system_prompt())
-            
-            trainings = await self._get_active_trainings()
+            compiled = await prompt_registry.get(self._get_default_system_prompt())
             
             rag_context = ""
             if user_query:
@@ -56,14 +67,9 @@ REGLAS:
 3. Menciona que la información proviene de IMAX cuando sea relevante
 4. El contexto IMAX tiene PRIORIDAD ABSOLUTA sobre cualquier otro conocimiento
 
-{base_prompt}"""
+{compiled.system_prompt}"""
             else:
-                full_prompt = base_prompt
-            
-            if trainings:
-                full_prompt += "\n\n## Reglas Adicionales:\n"
-                for training in trainings:
-                    full_prompt += f"\n### {training['name']}\n{training['content']}\n"
+                full_prompt = compiled.system_prompt
             
             return full_prompt
             
@@ -71,15 +77,17 @@ REGLAS:
             print(f"Error obteniendo system prompt: {e}")
             return self._get_default_system_prompt()
     
-    async def _get_rag_context(self, query: str, limit: int = 5) -> str:
-        """Obtiene contexto relevante usando búsqueda vectorial RAG"""
+    async def _get_rag_context(self, query: str, limit: int = 5, courses: List[str] | None = None) -> str:
+        """Obtiene contexto relevante usando búsqueda vectorial RAG (solo en `courses` si se indican)"""
         try:
-            chunks = await vector_service.search_similar_chunks(query, limit=limit)
+            chunks = await vector_service.search_similar_chunks(query, limit=limit, course_filter=courses)
             
             if not chunks:
                 return ""
             
-            return vector_service.format_context_for_llm(chunks)
+            # rag_context_max_tokens viene compilado con el prompt: sin consultas por mensaje
+            compiled = await prompt_registry.get(self._get_default_system_prompt())
+            return vector_service.format_context_for_llm(chunks, compiled.rag_context_max_tokens)
             
         except Exception as e:
             print(f"Error en búsqueda RAG: {e}")
@@ -93,45 +101,19 @@ Responde a las preguntas basándote ÚNICAMENTE en el contexto proporcionado cua
 Si hay contexto de IMAX, úsalo como base principal para tu respuesta.
 Sé profesional, educativo y amigable. Siempre recomienda consultar con profesionales para casos específicos."""
 
-    async def _get_config_value(self, name: str, default: str | None = None) -> str:
-        """Obtiene un valor de configuración desde ChatbotConfiguration"""
+    async def _get_allowed_courses(self, role_id: str) -> List[str] | None:
+        """Cursos que el rol puede consultar en el RAG (None = todos)"""
         try:
-            config = await sync_to_async(
-                lambda: ChatbotConfiguration.objects.filter(name=name, is_active=True).first()
-            )()
-            if config:
-                return config.value
-            from invitation_roles.models import BotConfiguration
-            bot_config = await sync_to_async(
-                lambda: BotConfiguration.objects.filter(name=name, is_active=True).first()
-            )()
-            return bot_config.value if bot_config else (default or "")
-        except Exception:
-            return default or ""
-    
-    async def _get_active_trainings(self) -> List[Dict]:
-        """Obtiene entrenamientos activos"""
-        try:
-            trainings = await sync_to_async(list)(
-                ChatbotTraining.objects.filter(is_active=True).order_by('-priority')
-            )
-            return [
-                {
-                    'name': t.name,
-                    'type': t.training_type,
-                    'content': t.content,
-                    'priority': t.priority
-                }
-                for t in trainings
-            ]
+            role = await role_registry.get(role_id)
+            return list(role.allowed_courses) if role and role.allowed_courses else None
         except Exception as e:
-            print(f"Error obteniendo entrenamientos: {e}")
-            return []
+            print(f"⚠️ Error obteniendo cursos del rol {role_id}: {e}")
+            return None
     
     async def get_context_messages(self, session: ChatbotSession, limit: int = 20) -> List[Dict]:
         """Obtiene mensajes de contexto para la conversación"""
         try:
-            messages = await sync_to_async(list)(
+            messages = await db_read(list)(
                 ChatbotMessage.objects.filter(
                     session=session
                 ).order_by('-created_at')[:limit]
@@ -153,66 +135,160 @@ Sé profesional, educativo y amigable. Siempre recomienda consultar con profesio
     async def generate_response(
         self, 
         user_message: str, 
-        session: ChatbotSession
+        session: ChatbotSession,
+        on_partial: Callable[[str], Awaitable[None]] | None = None
     ) -> Tuple[str, int, float]:
         """
         Genera respuesta de la IA usando OpenAI
         
+        on_partial: si se indica (y el streaming está activo) recibe el texto acumulado
+        a medida que llega la respuesta.
+        
         Returns:
             Tuple[str, int, float]: (respuesta, tokens_usados, tiempo_procesamiento)
+        
+        Raises:
+            AIServiceError: si falla la generación (para liberar el cupo reservado)
         """
         start_time = time.time()
+        timings = {}
         
         try:
-            base_system_prompt = await self._get_config_value('system_prompt', self._get_default_system_prompt())
-            trainings = await self._get_active_trainings()
+            # Historial, rol y embedding de la pregunta no dependen entre sí; el embedding
+            # queda en embedding_cache para el cache de respuestas y la búsqueda RAG
+            context_messages, allowed_courses, _ = await asyncio.gather(
+                self._timed(timings, 'history', self.get_context_messages(session)),
+                self._timed(timings, 'role', self._get_allowed_courses(session.role_id)),
+                self._timed(timings, 'embedding', self._prefetch_embedding(user_message)),
+            )
+            print(f"📝 Contexto: {len(context_messages)} mensajes previos en historial")
             
-            rag_context = ""
-            if user_message:
+            use_answer_cache = answer_cache.is_cacheable(context_messages)
+            if use_answer_cache:
                 try:
-                    rag_context = await self._get_rag_context(user_message)
-                    if rag_context:
-                        print(f"✅ RAG: Contexto encontrado ({len(rag_context)} caracteres)")
-                    else:
-                        print("⚠️ RAG: No se encontró contexto relevante")
+                    # El prompt compilado sale de memoria; su versión separa respuestas de prompts/modelos distintos
+                    compiled = await prompt_registry.get(self._get_default_system_prompt())
+                    cached = await self._timed(
+                        timings, 'answer_cache',
+                        answer_cache.lookup(user_message, allowed_courses, context_messages, compiled.version)
+                    )
+                    if cached:
+                        print(f"♻️ Respuesta reutilizada del cache (similitud {cached['similarity']:.3f})")
+                        self._log_timings(timings)
+                        return cached['answer'], 0, time.time() - start_time
                 except Exception as e:
-                    print(f"❌ Error obteniendo contexto RAG: {e}")
-            
-            system_content = base_system_prompt
-            if trainings:
-                system_content += "\n\n## Reglas Adicionales:\n"
-                for training in trainings:
-                    system_content += f"\n### {training['name']}\n{training['content']}\n"
-            
-            context_messages = await self.get_context_messages(session)
-            print(f"📝 Contexto: {len(context_messages)} mensajes previos en historial")
-            
-            messages = [{"role": "system", "content": system_content}]
-            messages.extend(context_messages)
+                    print(f"⚠️ Error consultando cache de respuestas: {e}")
             
-            if rag_context:
-                user_content = f"Contexto:\n{rag_context}\n\nPregunta: {user_message}"
-            else:
-                user_content = user_message
-            
-            messages.append({"role": "user", "content": user_content})
-            
-            response, tokens = await self._call_openai(messages)
+            # Preguntas idénticas simultáneas (p. ej. tras un anuncio) comparten una sola llamada
+            key = self._single_flight_key(user_message, context_messages, allowed_courses)
+            (response, tokens), shared = await single_flight.run(
+                key,
+                lambda publish: self._answer(user_message, context_messages, allowed_courses, use_answer_cache, publish, timings),
+                on_partial
+            )
+            if shared:
+                print("🔗 Respuesta compartida con una solicitud idéntica en curso")
+                tokens = 0
             
+            self._log_timings(timings)
             processing_time = time.time() - start_time
             
             return response, tokens, processing_time
             
         except Exception as e:
             print(f"Error generando respuesta: {e}")
-            processing_time = time.time() - start_time
-            return f"Lo siento, ocurrió un error al procesar tu mensaje. Por favor, inténtalo de nuevo. (Error: {str(e)[:100]})", 0, processing_time
+            raise AIServiceError(f"Lo siento, ocurrió un error al procesar tu mensaje. Por favor, inténtalo de nuevo. (Error: {str(e)[:100]})") from e
     
-    async def _call_openai(self, messages: List[Dict]) -> Tuple[str, int]:
-        """Llama a la API de OpenAI"""
+    async def _answer(
+        self,
+        user_message: str,
+        context_messages: List[Dict],
+        allowed_courses: List[str] | None,
+        use_answer_cache: bool,
+        on_partial: Callable[[str], Awaitable[None]] | None = None,
+        timings: Dict[str, float] | None = None
+    ) -> Tuple[str, int]:
+        """Arma el prompt (config, entrenamientos, RAG) y llama al LLM"""
+        timings = {} if timings is None else timings
+        
+        # El prompt compilado (system prompt + entrenamientos + modelo) sale de memoria
+        compiled, rag_context = await asyncio.gather(
+            self._timed(timings, 'prompt', prompt_registry.get(self._get_default_system_prompt())),
+            self._timed(timings, 'rag', self._get_rag_context_logged(user_message, allowed_courses)),
+        )
+        
+        # El system prompt va primero y no cambia entre mensajes: prefijo estable para el prompt caching de OpenAI
+        messages = [{"role": "system", "content": compiled.system_prompt}]
+        messages.extend(context_messages)
+        
+        if rag_context:
+            user_content = f"Contexto:\n{rag_context}\n\nPregunta: {user_message}"
+        else:
+            user_content = user_message
+        
+        messages.append({"role": "user", "content": user_content})
+        
+        response, tokens = await self._timed(timings, 'llm', self._call_openai(messages, on_partial, compiled.model))
+        
+        if use_answer_cache:
+            try:
+                await answer_cache.store(user_message, response, tokens, allowed_courses, context_messages, compiled.version)
+            except Exception as e:
+                print(f"⚠️ Error guardando en cache de respuestas: {e}")
+        
+        return response, tokens
+    
+    async def _timed(self, timings: Dict[str, float], name: str, awaitable):
+        """Espera `awaitable` registrando su duración en ms"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[name] = (time.perf_counter() - started) * 1000
+    
+    def _log_timings(self, timings: Dict[str, float]):
+        print("⏱️ Etapas: " + " ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items()))
+    
+    async def _prefetch_embedding(self, text: str):
+        """Calcula el embedding de la pregunta por adelantado (los errores se reportan en cada etapa)"""
+        try:
+            await vector_service.create_embedding(text)
+        except Exception as e:
+            print(f"⚠️ Error precalculando embedding: {e}")
+    
+    async def _get_rag_context_logged(self, user_message: str, allowed_courses: List[str] | None) -> str:
+        if not user_message:
+            return ""
+        try:
+            rag_context = await self._get_rag_context(user_message, courses=allowed_courses)
+            if rag_context:
+                print(f"✅ RAG: Contexto encontrado ({len(rag_context)} caracteres)")
+            else:
+                print("⚠️ RAG: No se encontró contexto relevante")
+            return rag_context
+        except Exception as e:
+            print(f"❌ Error obteniendo contexto RAG: {e}")
+            return ""
+    
+    def _single_flight_key(self, user_message: str, context_messages: List[Dict], allowed_courses: List[str] | None) -> str:
+        """Misma pregunta normalizada, mismo historial y mismos cursos → misma respuesta"""
+        raw = json.dumps(
+            [embedding_cache.normalize(user_message), context_messages, sorted(allowed_courses or [])],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    async def _call_openai(
+        self,
+        messages: List[Dict],
+        on_partial: Callable[[str], Awaitable[None]] | None = None,
+        model_name: str | None = None
+    ) -> Tuple[str, int]:
+        """Llama a la API de OpenAI (en streaming SSE si hay on_partial)"""
         api_key = self._get_api_key()
         
-        model_name = await self._get_config_value('openai_model', 'gpt-4o-mini')
+        if not model_name:
+            model_name = (await prompt_registry.get(self._get_default_system_prompt())).model
         print(f"🔍 Usando modelo OpenAI: {model_name}")
         
         headers = {
@@ -228,34 +304,81 @@ Sé profesional, educativo y amigable. Siempre recomienda consultar con profesio
             "stream": False
         }
         
-        async with aiohttp.ClientSession() as session:
-            for attempt in range(self.max_retries):
-                try:
-                    async with session.post(
-                        "https://api.openai.com/v1/chat/completions",
-                        headers=headers,
-                        json=data,
-                        timeout=aiohttp.ClientTimeout(total=self.timeout)
-                    ) as response:
-                        if response.status == 200:
-                            result = await response.json()
-                            content = result['choices'][0]['message']['content']
-                            tokens = result['usage']['total_tokens']
-                            return content, tokens
-                        else:
-                            error_text = await response.text()
-                            raise Exception(f"OpenAI API error {response.status}: {error_text}")
-                
-                except asyncio.TimeoutError:
-                    if attempt == self.max_retries - 1:
-                        raise Exception("Timeout en OpenAI API")
-                    await asyncio.sleep(2 ** attempt)
-                except Exception as e:
-                    if attempt == self.max_retries - 1:
-                        raise e
-                    await asyncio.sleep(2 ** attempt)
+        stream = on_partial is not None and settings.CHATBOT_STREAMING_ENABLED
+        if stream:
+            data["stream"] = True
+            data["stream_options"] = {"include_usage": True}
+            # En streaming el límite es entre fragmentos, no para la respuesta completa
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        else:
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+        
+        # Una vez mostrado texto parcial no se reintenta: el reintento publicaría otra respuesta encima
+        published = False
+        
+        async def publish(text: str):
+            nonlocal published
+            published = True
+            await on_partial(text)
+        
+        session = await openai_http.get_session()
+        for attempt in range(self.max_retries):
+            try:
+                async with session.post(
+                    openai_url('chat/completions'),
+                    headers=headers,
+                    json=data,
+                    timeout=timeout
+                ) as response:
+                    if response.status == 200 and stream:
+                        return await self._read_stream(response, publish)
+                    if response.status == 200:
+                        result = await response.json()
+                        content = result['choices'][0]['message']['content']
+                        tokens = result['usage']['total_tokens']
+                        return content, tokens
+                    else:
+                        error_text = await response.text()
+                        raise Exception(f"OpenAI API error {response.status}: {error_text}")
+            
+            except asyncio.TimeoutError:
+                if published or attempt == self.max_retries - 1:
+                    raise Exception("Timeout en OpenAI API")
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                if published or attempt == self.max_retries - 1:
+                    raise e
+                await asyncio.sleep(2 ** attempt)
         
         raise Exception("Error inesperado en OpenAI API")
+    
+    async def _read_stream(
+        self,
+        response: aiohttp.ClientResponse,
+        on_partial: Callable[[str], Awaitable[None]]
+    ) -> Tuple[str, int]:
+        """Consume los eventos SSE de chat/completions y devuelve (respuesta, tokens)"""
+        parts = []
+        tokens = 0
+        
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == '[DONE]':
+                break
+            
+            event = json.loads(payload)
+            if event.get('usage'):
+                tokens = event['usage']['total_tokens']
+            for choice in event.get('choices', []):
+                delta = (choice.get('delta') or {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    await on_partial(''.join(parts))
+        
+        return ''.join(parts), tokens
 
 
 ai_service = AIService()
@@ -0,0 +1,110 @@
+import json
+import hashlib
+from datetime import timedelta
+from typing import Dict, List
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from pgvector.django import CosineDistance
+from .vector_service import vector_service
+
+
+class AnswerCache:
+    """Cache semántico de respuestas: reutiliza la respuesta de una pregunta casi idéntica"""
+
+    def __init__(self):
+        self.enabled = settings.CHATBOT_ANSWER_CACHE_ENABLED
+        self.min_similarity = settings.CHATBOT_ANSWER_CACHE_SIMILARITY
+        self.max_history = settings.CHATBOT_ANSWER_CACHE_MAX_HISTORY
+        self.ttl = timedelta(hours=settings.CHATBOT_ANSWER_CACHE_TTL_HOURS)
+
+    def is_cacheable(self, context_messages: list) -> bool:
+        """Solo se reutilizan respuestas cuando el historial es vacío o corto"""
+        return self.enabled and len(context_messages) <= self.max_history
+
+    def scope_for(
+        self,
+        courses: List[str] | None,
+        context_messages: list | None = None,
+        prompt_version: str | None = None
+    ) -> str:
+        """Clave de alcance: cursos consultados, versión del prompt y, si hay historial, un hash del historial
+
+        Una respuesta que depende de mensajes previos solo se reutiliza con exactamente
+        el mismo historial; una generada con otro prompt o modelo no se reutiliza nunca.
+        """
+        scope = ','.join(sorted(courses)) if courses else ''
+        if prompt_version:
+            scope += f"|p:{prompt_version}"
+        if context_messages:
+            history = json.dumps(context_messages, ensure_ascii=False, sort_keys=True)
+            scope += f"|h:{hashlib.sha256(history.encode('utf-8')).hexdigest()[:16]}"
+        return scope
+
+    async def lookup(
+        self,
+        question: str,
+        courses: List[str] | None = None,
+        context_messages: list | None = None,
+        prompt_version: str | None = None
+    ) -> Dict | None:
+        """Busca una respuesta previa cuya pregunta esté dentro del umbral de similitud"""
+        from .models import ChatbotAnswerCache
+
+        query_embedding = await vector_service.create_embedding(question)
+
+        def find():
+            entry = (
+                ChatbotAnswerCache.objects
+                .filter(created_at__gte=timezone.now() - self.ttl, course_scope=self.scope_for(courses, context_messages, prompt_version))
+                .annotate(distance=CosineDistance('query_embedding', query_embedding))
+                .filter(distance__lte=1 - self.min_similarity)
+                .order_by('distance')
+                .first()
+            )
+            if not entry:
+                return None
+
+            ChatbotAnswerCache.objects.filter(pk=entry.pk).update(hit_count=F('hit_count') + 1)
+            return {
+                'answer': entry.answer,
+                'question': entry.question,
+                'similarity': 1 - entry.distance,
+            }
+
+        return await sync_to_async(find)()
+
+    async def store(
+        self,
+        question: str,
+        answer: str,
+        tokens_used: int,
+        courses: List[str] | None = None,
+        context_messages: list | None = None,
+        prompt_version: str | None = None
+    ):
+        """Guarda una respuesta generada por el LLM"""
+        from .models import ChatbotAnswerCache
+
+        query_embedding = await vector_service.create_embedding(question)
+        await sync_to_async(ChatbotAnswerCache.objects.create)(
+            question=question,
+            query_embedding=query_embedding,
+            answer=answer,
+            tokens_used=tokens_used,
+            course_scope=self.scope_for(courses, context_messages, prompt_version),
+        )
+
+
+def invalidate_answer_cache() -> int:
+    """Vacía el cache de respuestas (cambió el prompt, el entrenamiento o la base de conocimiento)"""
+    from .models import ChatbotAnswerCache
+
+    deleted, _ = ChatbotAnswerCache.objects.all().delete()
+    if deleted:
+        print(f"🧹 Cache de respuestas invalidado ({deleted} entradas)")
+    return deleted
+
+
+answer_cache = AnswerCache()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ChatbotAiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatbot_ai'
+
+    def ready(self):
+        from . import signals  # noqa: F401
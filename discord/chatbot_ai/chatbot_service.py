@@ -1,14 +1,17 @@
 import asyncio
-from typing import Optional, Tuple, List
-from datetime import datetime, timedelta
+from typing import Optional, Tuple, List, Callable, Awaitable
+from datetime import date, datetime, timedelta
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Greatest
 from asgiref.sync import sync_to_async
 from .models import (
     ChatbotSession, ChatbotMessage, ChatbotRole, 
     ChatbotUsage, ChatbotConfiguration
 )
-from .ai_service import ai_service
+from .ai_service import ai_service, AIServiceError
+from .role_registry import role_registry
 
 class ChatbotService:
     """Servicio principal del chatbot"""
@@ -30,18 +33,10 @@ class ChatbotService:
                 return False, "❌ Tu rol no tiene acceso al chatbot de IA"
             
             # Verificar límites diarios y mensuales
-            usage = await self._get_user_usage(user_id)
-            today = timezone.now().date()
-            
-            daily_count = usage.daily_count if usage.date == today else 0
-            is_same_month = usage.date.year == today.year and usage.date.month == today.month
-            monthly_count = usage.monthly_count if is_same_month else 0
-            
-            if daily_count >= chatbot_role.daily_limit:
-                return False, f"❌ Has alcanzado tu límite diario de {chatbot_role.daily_limit} mensajes"
-            
-            if monthly_count >= chatbot_role.monthly_limit:
-                return False, f"❌ Has alcanzado tu límite mensual de {chatbot_role.monthly_limit} mensajes"
+            daily_count, monthly_count = await self._get_user_usage(user_id)
+            error_msg = self._limit_error(chatbot_role, daily_count, monthly_count)
+            if error_msg:
+                return False, error_msg
             
             return True, "✅ Puedes usar el chatbot"
             
@@ -49,6 +44,52 @@ class ChatbotService:
             print(f"Error verificando acceso al chatbot: {e}")
             return False, "❌ Error verificando permisos"
     
+    async def reserve_usage(self, user_id: str, role_id: str) -> Tuple[bool, str, Optional[date]]:
+        """
+        Verifica el acceso y reserva un mensaje del cupo en una sola sentencia atómica
+        
+        Mensajes simultáneos del mismo usuario no pueden superar los límites. Si la
+        respuesta falla, process_message libera la reserva.
+        
+        Returns:
+            Tuple[bool, str, Optional[date]]: (puede_usar, mensaje_error, fecha_de_la_reserva)
+        """
+        try:
+            chatbot_role = await self._get_chatbot_role(role_id)
+            if not chatbot_role:
+                return False, "❌ Tu rol no tiene acceso al chatbot de IA", None
+            
+            today = timezone.now().date()
+            reserved = await sync_to_async(self._reserve_slot)(
+                user_id, role_id, today, chatbot_role.daily_limit, chatbot_role.monthly_limit
+            )
+            if reserved:
+                return True, "✅ Puedes usar el chatbot", today
+            
+            # Sin cupo: una lectura extra solo para explicar qué límite se alcanzó
+            daily_count, monthly_count = await self._get_user_usage(user_id)
+            error_msg = self._limit_error(chatbot_role, daily_count, monthly_count)
+            return False, error_msg or f"❌ Has alcanzado tu límite diario de {chatbot_role.daily_limit} mensajes", None
+            
+        except Exception as e:
+            print(f"Error reservando cupo del chatbot: {e}")
+            return False, "❌ Error verificando permisos", None
+    
+    async def release_usage(self, user_id: str, reserved_date: Optional[date]):
+        """Devuelve al cupo un mensaje reservado cuya respuesta falló"""
+        if not reserved_date:
+            return
+        try:
+            await sync_to_async(
+                lambda: ChatbotUsage.objects.filter(user_id=user_id, date=reserved_date).update(
+                    daily_count=Greatest(F('daily_count') - 1, 0),
+                    monthly_count=Greatest(F('monthly_count') - 1, 0),
+                    updated_at=timezone.now()
+                )
+            )()
+        except Exception as e:
+            print(f"Error liberando cupo del chatbot: {e}")
+    
     async def create_or_get_session(self, user_id: str, username: str, channel_id: str, role_id: str) -> ChatbotSession:
         """Crea o obtiene una sesión activa del chatbot"""
         try:
@@ -89,47 +130,54 @@ class ChatbotService:
         self, 
         session: ChatbotSession, 
         user_message: str, 
-        message_id: str
+        message_id: str,
+        on_partial: Callable[[str], Awaitable[None]] | None = None,
+        reserved_date: Optional[date] = None
     ) -> Tuple[str, bool]:
         """
         Procesa un mensaje del usuario
         
+        on_partial recibe la respuesta parcial mientras se genera (streaming).
+        reserved_date es la reserva hecha con reserve_usage; se libera si la respuesta falla.
+        
         Returns:
             Tuple[str, bool]: (respuesta_ai, éxito)
         """
+        success = False
         try:
             # Generar respuesta con IA
             ai_response, tokens_used, processing_time = await self.ai_service.generate_response(
-                user_message, session
+                user_message, session, on_partial
             )
             
             # Guardar mensaje en la base de datos
             await self._save_message(session, message_id, user_message, ai_response, tokens_used, processing_time)
             
-            # Actualizar contadores de uso
-            await self._update_usage_counters(session.user_id)
-            
+            success = True
             return ai_response, True
             
+        except AIServiceError as e:
+            return str(e), False
+            
         except Exception as e:
             print(f"Error procesando mensaje: {e}")
             error_msg = f"Lo siento, ocurrió un error al procesar tu mensaje. Por favor, inténtalo de nuevo."
             return error_msg, False
+        
+        finally:
+            # También si la tarea se cancela (CancelledError no es Exception)
+            if not success:
+                await asyncio.shield(self.release_usage(session.user_id, reserved_date))
     
     async def get_usage_stats(self, user_id: str) -> dict:
         """Obtiene estadísticas de uso del usuario"""
         try:
-            usage = await self._get_user_usage(user_id)
+            daily_used, monthly_used = await self._get_user_usage(user_id)
             chatbot_role = await self._get_chatbot_role_by_user_id(user_id)
             
             if not chatbot_role:
                 return {"error": "Rol no encontrado"}
             
-            today = timezone.now().date()
-            daily_used = usage.daily_count if usage.date == today else 0
-            is_same_month = usage.date.year == today.year and usage.date.month == today.month
-            monthly_used = usage.monthly_count if is_same_month else 0
-            
             return {
                 "daily_used": daily_used,
                 "daily_limit": chatbot_role.daily_limit,
@@ -163,9 +211,7 @@ class ChatbotService:
     async def _get_chatbot_role(self, role_id: str) -> Optional[ChatbotRole]:
         """Obtiene configuración de rol para chatbot"""
         try:
-            return await sync_to_async(
-                lambda: ChatbotRole.objects.filter(role_id=role_id, is_active=True).first()
-            )()
+            return await role_registry.get(role_id)
         except Exception:
             return None
     
@@ -182,34 +228,66 @@ class ChatbotService:
         except Exception:
             return None
     
-    async def _get_user_usage(self, user_id: str) -> ChatbotUsage:
-        """Obtiene o crea registro de uso del usuario"""
+    def _limit_error(self, chatbot_role: ChatbotRole, daily_count: int, monthly_count: int) -> str | None:
+        """Mensaje del límite alcanzado (None si aún hay cupo)"""
+        if daily_count >= chatbot_role.daily_limit:
+            return f"❌ Has alcanzado tu límite diario de {chatbot_role.daily_limit} mensajes"
+        if monthly_count >= chatbot_role.monthly_limit:
+            return f"❌ Has alcanzado tu límite mensual de {chatbot_role.monthly_limit} mensajes"
+        return None
+    
+    async def _get_user_usage(self, user_id: str) -> Tuple[int, int]:
+        """Mensajes usados hoy y en el mes en curso (una consulta, sin crear registros)"""
         try:
             today = timezone.now().date()
-            from .models import ChatbotUsage as UsageModel
-            
-            def get_or_create_usage():
-                return UsageModel.objects.get_or_create(
-                    user_id=user_id,
-                    date=today,
-                    defaults={
-                        'role_id': '',
-                        'daily_count': 0,
-                        'monthly_count': 0
-                    }
-                )
-            
-            usage, created = await sync_to_async(get_or_create_usage)()
-            return usage
+            latest = await sync_to_async(
+                lambda: ChatbotUsage.objects.filter(
+                    user_id=user_id, date__gte=today.replace(day=1), date__lte=today
+                ).order_by('-date').values_list('date', 'daily_count', 'monthly_count').first()
+            )()
+            if not latest:
+                return 0, 0
+            usage_date, daily_count, monthly_count = latest
+            return (daily_count if usage_date == today else 0), monthly_count
         except Exception as e:
             print(f"Error obteniendo uso del usuario: {e}")
-            from .models import ChatbotUsage
-            return ChatbotUsage(
-                user_id=user_id,
-                date=timezone.now().date(),
-                daily_count=0,
-                monthly_count=0
+            return 0, 0
+    
+    def _reserve_slot(self, user_id: str, role_id: str, today: date, daily_limit: int, monthly_limit: int) -> bool:
+        """UPSERT condicional sobre (user_id, date): suma 1 solo si ambos contadores están bajo su límite
+        
+        El registro de un día nuevo arranca el contador mensual desde el último registro
+        del mes; si la condición falla no se devuelve ninguna fila y no se modifica nada.
+        """
+        table = connection.ops.quote_name(ChatbotUsage._meta.db_table)
+        sql = f"""
+            WITH previous AS (
+                SELECT COALESCE(MAX(monthly_count), 0) AS monthly_count
+                FROM {table}
+                WHERE user_id = %(user_id)s AND date >= %(month_start)s AND date < %(today)s
             )
+            INSERT INTO {table} (user_id, role_id, date, daily_count, monthly_count, created_at, updated_at)
+            SELECT %(user_id)s, %(role_id)s, %(today)s, 1, previous.monthly_count + 1, NOW(), NOW()
+            FROM previous
+            WHERE %(daily_limit)s > 0 AND previous.monthly_count < %(monthly_limit)s
+            ON CONFLICT (user_id, date) DO UPDATE SET
+                daily_count = {table}.daily_count + 1,
+                monthly_count = {table}.monthly_count + 1,
+                role_id = EXCLUDED.role_id,
+                updated_at = NOW()
+            WHERE {table}.daily_count < %(daily_limit)s AND {table}.monthly_count < %(monthly_limit)s
+            RETURNING daily_count
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'user_id': user_id,
+                'role_id': role_id,
+                'today': today,
+                'month_start': today.replace(day=1),
+                'daily_limit': daily_limit,
+                'monthly_limit': monthly_limit,
+            })
+            return cursor.fetchone() is not None
     
     async def _save_message(
         self, 
@@ -234,35 +312,6 @@ class ChatbotService:
             )
         except Exception as e:
             print(f"Error guardando mensaje: {e}")
-    
-    async def _update_usage_counters(self, user_id: str):
-        """Actualiza contadores de uso del usuario"""
-        try:
-            today = timezone.now().date()
-            from .models import ChatbotUsage as UsageModel
-            
-            def update_counters():
-                with transaction.atomic():
-                    usage, created = UsageModel.objects.get_or_create(
-                        user_id=user_id,
-                        date=today,
-                        defaults={'daily_count': 0, 'monthly_count': 0}
-                    )
-                    
-                    usage.daily_count += 1
-                    
-                    is_same_month = usage.date.year == today.year and usage.date.month == today.month
-                    if is_same_month:
-                        usage.monthly_count += 1
-                    else:
-                        usage.monthly_count = 1
-                    
-                    usage.save()
-            
-            await sync_to_async(update_counters)()
-                
-        except Exception as e:
-            print(f"Error actualizando contadores: {e}")
 
 # Instancia global del servicio
 chatbot_service = ChatbotService()
@@ -0,0 +1,68 @@
+import re
+import hashlib
+from typing import List, Dict
+import tiktoken
+
+
+# Sin imports de Django: este módulo se ejecuta en los procesos del pool de indexación
+_tokenizer = None
+
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = tiktoken.get_encoding("cl100k_base")
+    return _tokenizer
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 del contenido de un chunk"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def simhash(text: str) -> int:
+    """Huella SimHash de 64 bits sobre shingles de 3 palabras (entero con signo, cabe en un BigIntegerField)"""
+    words = re.findall(r'\w+', text.lower())
+    shingles = [' '.join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))]
+    
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    
+    fingerprint = sum(1 << bit for bit in range(64) if weights[bit] > 0)
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Bits distintos entre dos huellas SimHash"""
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+
+def split_into_chunks(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[Dict]:
+    """Divide el texto en chunks de `chunk_size` tokens con overlap (incluye hash y SimHash de cada chunk)"""
+    text = text.strip()
+    if not text:
+        return []
+    
+    tokenizer = get_tokenizer()
+    tokens = tokenizer.encode(text)
+    chunks = []
+    
+    start = 0
+    while start < len(tokens):
+        end = start + chunk_size
+        chunk_tokens = tokens[start:end]
+        chunk_text = tokenizer.decode(chunk_tokens).strip()
+        
+        chunks.append({
+            'text': chunk_text,
+            'tokens': len(chunk_tokens),
+            'hash': hash_text(chunk_text),
+            'simhash': simhash(chunk_text),
+        })
+        
+        start = end - chunk_overlap
+    
+    return chunks
@@ -0,0 +1,79 @@
+from typing import List, Dict
+from .chunking import get_tokenizer
+
+
+class ContextBuilder:
+    """Arma el contexto RAG: fusiona chunks consecutivos del mismo archivo y respeta un presupuesto de tokens"""
+    
+    def __init__(self):
+        self.default_max_tokens = 2000
+        self.min_overlap_chars = 20
+        self.max_overlap_chars = 2000
+        self.min_section_tokens = 100
+    
+    def build(self, chunks: List[Dict], max_tokens: int | None = None) -> str:
+        """Contexto para el LLM con las secciones ordenadas por relevancia"""
+        if not chunks:
+            return ""
+        
+        tokenizer = get_tokenizer()
+        remaining = max_tokens or self.default_max_tokens
+        parts = []
+        
+        for group in self._group_adjacent(chunks):
+            header = f"[{group[0]['course']} - {group[0]['module']}]\n"
+            text = self._merge_group(group)
+            
+            available = remaining - len(tokenizer.encode(header))
+            if available < self.min_section_tokens:
+                break
+            
+            tokens = tokenizer.encode(text)
+            if len(tokens) > available:
+                text = tokenizer.decode(tokens[:available]).rstrip() + " …"
+                tokens = tokens[:available]
+            
+            parts.append(header + text)
+            remaining = available - len(tokens)
+        
+        return "\n\n".join(parts)
+    
+    def _group_adjacent(self, chunks: List[Dict]) -> List[List[Dict]]:
+        """Agrupa hits del mismo archivo con chunk_index consecutivo (el grupo hereda el mejor ranking)"""
+        by_source = {}
+        for rank, chunk in enumerate(chunks):
+            by_source.setdefault((chunk['course'], chunk['source_file']), []).append((rank, chunk))
+        
+        groups = []
+        for hits in by_source.values():
+            hits.sort(key=lambda hit: hit[1]['chunk_index'])
+            current = [hits[0]]
+            for hit in hits[1:]:
+                if hit[1]['chunk_index'] == current[-1][1]['chunk_index'] + 1:
+                    current.append(hit)
+                else:
+                    groups.append(current)
+                    current = [hit]
+            groups.append(current)
+        
+        groups.sort(key=lambda group: min(rank for rank, _ in group))
+        return [[chunk for _, chunk in group] for group in groups]
+    
+    def _merge_group(self, group: List[Dict]) -> str:
+        text = group[0]['content']
+        for chunk in group[1:]:
+            overlap = self._overlap_length(text, chunk['content'])
+            separator = "" if overlap else "\n"
+            text = text + separator + chunk['content'][overlap:]
+        return text
+    
+    def _overlap_length(self, previous: str, following: str) -> int:
+        """Caracteres del inicio de `following` que repiten el final de `previous` (el overlap del chunking)"""
+        longest = min(len(previous), len(following), self.max_overlap_chars)
+        for length in range(longest, self.min_overlap_chars - 1, -1):
+            if previous.endswith(following[:length]):
+                return length
+        return 0
+
+
+context_builder = ContextBuilder()
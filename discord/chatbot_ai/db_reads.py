@@ -0,0 +1,27 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Awaitable, Any
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+# Cada hilo abre su propia conexión a Postgres: un pool acotado limita cuántas puede tener el bot
+_executor = ThreadPoolExecutor(max_workers=settings.CHATBOT_DB_READ_THREADS, thread_name_prefix='chatbot-db-read')
+
+
+def _run(func: Callable, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Como al terminar una petición de Django: cierra la conexión si está rota o vencida (CONN_MAX_AGE)
+        close_old_connections()
+
+
+def db_read(func: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+    """sync_to_async para lecturas que deben correr en paralelo (etapas de asyncio.gather)
+
+    A diferencia de sync_to_async(thread_sensitive=False), no usa el executor por defecto
+    del loop, cuyos hilos dejan una conexión abierta cada uno durante toda la vida del bot.
+    """
+    return sync_to_async(functools.partial(_run, func), thread_sensitive=False, executor=_executor)
@@ -1,9 +1,15 @@
+import time
 import discord
 import asyncio
+from collections import Counter
+from django.conf import settings
 from discord.ext import commands
 from discord.ui import Button, View
 from asgiref.sync import sync_to_async
+from invitation_roles.config_registry import config_registry
 from .chatbot_service import chatbot_service
+from .http_client import openai_http
+from .role_registry import role_registry
 from .models import ChatbotSession, ChatbotRole, ChatbotTraining
 
 
@@ -95,6 +101,44 @@ class StartChatbotView(View):
             print(f"Error en botón de iniciar chat: {e}")
             await interaction.followup.send("❌ Error al procesar tu solicitud. Por favor, inténtalo de nuevo.", ephemeral=True)
 
+class ProgressiveReply:
+    """Edita un mensaje con la respuesta parcial, agrupando las actualizaciones para respetar el rate limit de ediciones"""
+    
+    def __init__(self, message: discord.Message, render, interval: float | None = None):
+        self.message = message
+        self.render = render
+        self.interval = settings.CHATBOT_STREAM_EDIT_INTERVAL if interval is None else interval
+        self._latest = ""
+        self._last_edit = 0.0
+        self._task: asyncio.Task | None = None
+    
+    async def update(self, text: str):
+        """Registra el texto acumulado; la edición se programa sin bloquear el stream"""
+        self._latest = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+    
+    async def _flush(self):
+        # La primera edición es inmediata; las siguientes esperan el intervalo y envían lo último recibido
+        delay = self._last_edit + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._last_edit = time.monotonic()
+        try:
+            await self.message.edit(content=None, embed=self.render(self._latest + " ▌"))
+        except discord.HTTPException as e:
+            print(f"⚠️ Error editando respuesta parcial: {e}")
+    
+    async def finish(self):
+        """Descarta la edición pendiente (el llamador hace la edición final)"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
 class ChatbotCog(commands.Cog):
     """Comandos del chatbot de IA"""
     
@@ -102,6 +146,12 @@ class ChatbotCog(commands.Cog):
         self.bot = bot
         self.chatbot_service = chatbot_service
         self.chatbot_view = StartChatbotView(self)
+        # Eventos on_message por decisión del router (procesados y descartados por motivo)
+        self.message_stats = Counter()
+    
+    async def cog_unload(self):
+        """Cierra el pool HTTP de OpenAI al apagar el bot"""
+        await openai_http.close()
     
     @commands.Cog.listener()
     async def on_ready(self):
@@ -111,30 +161,39 @@ class ChatbotCog(commands.Cog):
     @commands.Cog.listener()
     async def on_message(self, message):
         """Escucha mensajes en DMs del bot"""
+        route = self._route_message(message)
+        self.message_stats[route] += 1
+        if route != 'dm':
+            return
+        
+        # Procesar mensaje del chatbot en DM
+        await self._process_dm_message(message)
+    
+    def _route_message(self, message) -> str:
+        """Decide qué hacer con un mensaje solo con datos en memoria (sin I/O)
+        
+        Se ejecuta para cada mensaje de cada canal visible, así que va del filtro más
+        barato y más frecuente al menos frecuente.
+        """
         # Ignorar mensajes del bot
         if message.author.bot:
-            return
+            return 'ignored_bot'
         
         # Solo procesar mensajes en DMs (no en canales del servidor)
-        if not isinstance(message.channel, discord.DMChannel):
-            return
+        if message.guild is not None or not isinstance(message.channel, discord.DMChannel):
+            return 'ignored_guild'
         
         # Ignorar comandos (empiezan con !)
         if message.content.startswith('!'):
-            return
+            return 'ignored_command'
         
-        # Procesar mensaje del chatbot en DM
-        await self._process_dm_message(message)
+        return 'dm'
     
     async def _is_chatbot_channel(self, channel) -> bool:
-        """Verifica si el canal es un canal de chatbot"""
-        try:
-            # Solo verificar configuración del canal específico
-            chatbot_channel_id = await self._get_bot_config('chatbot_channel_id')
-            return bool(chatbot_channel_id and str(channel.id) == str(chatbot_channel_id))
-            
-        except Exception:
-            return False
+        """Verifica si el canal es un canal de chatbot (copia en memoria de la configuración)"""
+        # aget y no peek: peek nunca carga, en un proceso sin lecturas previas siempre daría False
+        chatbot_channel_id = await self._get_bot_config('chatbot_channel_id')
+        return bool(chatbot_channel_id and str(channel.id) == str(chatbot_channel_id))
     
     async def _process_dm_message(self, message):
         """Procesa un mensaje del chatbot recibido por DM"""
@@ -173,37 +232,40 @@ class ChatbotCog(commands.Cog):
                 await message.channel.send("❌ No se pudo determinar tu rol. Contacta a un administrador.")
                 return
             
-            # Verificar permisos
-            can_use, error_msg = await self.chatbot_service.can_user_use_chatbot(user_id, user_role_id)
+            # Verificar permisos y reservar un mensaje del cupo (una sola sentencia atómica)
+            can_use, error_msg, reserved_date = await self.chatbot_service.reserve_usage(user_id, user_role_id)
             if not can_use:
                 await message.channel.send(error_msg)
                 return
             
-            # Mostrar que está procesando
-            processing_msg = await message.channel.send("🤖 Procesando tu mensaje...")
-            
-            # Crear o obtener sesión (usando channel_id especial para DMs)
-            session = await self.chatbot_service.create_or_get_session(
-                user_id, username, channel_id, user_role_id
-            )
-            
-            # Procesar mensaje
-            ai_response, success = await self.chatbot_service.process_message(
-                session, message.content, str(message.id)
+            try:
+                # Mostrar que está procesando
+                processing_msg = await message.channel.send("🤖 Procesando tu mensaje...")
+                
+                # Crear o obtener sesión (usando channel_id especial para DMs)
+                session = await self.chatbot_service.create_or_get_session(
+                    user_id, username, channel_id, user_role_id
+                )
+            except BaseException:
+                # También si se cancela: process_message aún no tiene la reserva
+                await self.chatbot_service.release_usage(user_id, reserved_date)
+                raise
+            
+            # Procesar mensaje (la respuesta parcial se va mostrando en processing_msg)
+            progressive = ProgressiveReply(
+                processing_msg,
+                lambda text: self._build_response_embed(text, True, message.author)
             )
+            try:
+                ai_response, success = await self.chatbot_service.process_message(
+                    session, message.content, str(message.id), on_partial=progressive.update,
+                    reserved_date=reserved_date
+                )
+            finally:
+                await progressive.finish()
             
             # Enviar respuesta
-            embed = discord.Embed(
-                title="🤖 Asistente IA",
-                description=ai_response,
-                color=0xffffff if success else 0xff0000
-            )
-            
-            embed.set_footer(
-                text=f"Respondiendo a {username}",
-                icon_url=message.author.avatar.url if message.author.avatar else None
-            )
-            
+            embed = self._build_response_embed(ai_response, success, message.author)
             await processing_msg.edit(content=None, embed=embed)
             
         except Exception as e:
@@ -213,6 +275,19 @@ class ChatbotCog(commands.Cog):
             except:
                 pass
     
+    def _build_response_embed(self, text: str, success: bool, author) -> discord.Embed:
+        """Embed de respuesta del asistente"""
+        embed = discord.Embed(
+            title="🤖 Asistente IA",
+            description=text[:4096],
+            color=0xffffff if success else 0xff0000
+        )
+        embed.set_footer(
+            text=f"Respondiendo a {author.display_name}",
+            icon_url=author.avatar.url if author.avatar else None
+        )
+        return embed
+    
     async def _process_chatbot_message(self, message):
         """Procesa un mensaje del chatbot"""
         try:
@@ -226,23 +301,27 @@ class ChatbotCog(commands.Cog):
                 await message.reply("❌ No se pudo determinar tu rol. Contacta a un administrador.")
                 return
             
-            # Verificar permisos
-            can_use, error_msg = await self.chatbot_service.can_user_use_chatbot(user_id, user_role_id)
+            # Verificar permisos y reservar un mensaje del cupo
+            can_use, error_msg, reserved_date = await self.chatbot_service.reserve_usage(user_id, user_role_id)
             if not can_use:
                 await message.reply(error_msg)
                 return
             
-            # Mostrar que está procesando en el canal
-            processing_msg = await message.reply("🤖 Procesando tu mensaje... Te enviaré la respuesta por DM.")
-            
-            # Crear o obtener sesión
-            session = await self.chatbot_service.create_or_get_session(
-                user_id, username, channel_id, user_role_id
-            )
+            try:
+                # Mostrar que está procesando en el canal
+                processing_msg = await message.reply("🤖 Procesando tu mensaje... Te enviaré la respuesta por DM.")
+                
+                # Crear o obtener sesión
+                session = await self.chatbot_service.create_or_get_session(
+                    user_id, username, channel_id, user_role_id
+                )
+            except BaseException:
+                await self.chatbot_service.release_usage(user_id, reserved_date)
+                raise
             
             # Procesar mensaje
             ai_response, success = await self.chatbot_service.process_message(
-                session, message.content, str(message.id)
+                session, message.content, str(message.id), reserved_date=reserved_date
             )
             
             # Intentar enviar respuesta por DM
@@ -436,16 +515,10 @@ class ChatbotCog(commands.Cog):
     async def _get_user_role_id(self, member) -> str:
         """Obtiene el ID del rol más alto del usuario"""
         try:
-            # Obtener roles del usuario ordenados por posición (más alto primero)
-            user_roles = sorted(member.roles, key=lambda r: r.position, reverse=True)
-            
-            # Buscar el primer rol que esté configurado en el chatbot
-            for role in user_roles:
-                chatbot_role = await sync_to_async(
-                    lambda: ChatbotRole.objects.filter(role_id=str(role.id), is_active=True).first()
-                )()
-                if chatbot_role:
-                    return str(role.id)
+            # Intersección con los roles configurados (en memoria, sin consultas)
+            chatbot_role = await role_registry.resolve({str(role.id): role.position for role in member.roles})
+            if chatbot_role:
+                return chatbot_role.role_id
             
             # Si no tiene rol configurado, usar el rol por defecto
             default_role_id = await self._get_bot_config('default_chatbot_role_id')
@@ -457,14 +530,8 @@ class ChatbotCog(commands.Cog):
     
     async def _get_bot_config(self, name: str, default: str | None = None) -> str:
         """Obtiene configuración del bot"""
-        try:
-            from invitation_roles.models import BotConfiguration
-            config = await sync_to_async(
-                lambda: BotConfiguration.objects.filter(name=name, is_active=True).first()
-            )()
-            return config.value if config else (default or "")
-        except Exception:
-            return default or ""
+        value = await config_registry.aget(name)
+        return value if value is not None else (default or "")
     
     @commands.command(name='ai_stats')
     async def ai_stats(self, ctx):
@@ -644,6 +711,26 @@ class ChatbotCog(commands.Cog):
             print(f"Error en limpieza: {e}")
             await ctx.reply("❌ Error durante la limpieza")
     
+    @commands.command(name='ai_router')
+    @commands.has_permissions(administrator=True)
+    async def ai_router(self, ctx):
+        """Muestra cuántos mensajes procesó y descartó el router del chatbot (solo admins)"""
+        labels = {
+            'dm': '💬 Procesados (DM)',
+            'ignored_bot': '🤖 Descartados: bots',
+            'ignored_guild': '🏠 Descartados: canales del servidor',
+            'ignored_command': '⌨️ Descartados: comandos',
+        }
+        total = sum(self.message_stats.values())
+        lines = [f"{label}: **{self.message_stats[key]}**" for key, label in labels.items()]
+        
+        embed = discord.Embed(
+            title="📨 Router de Mensajes del Chatbot",
+            description="\n".join(lines) + f"\n\nTotal desde el arranque: **{total}**",
+            color=0x00ff00
+        )
+        await ctx.reply(embed=embed)
+    
     @commands.command(name='ai_roles')
     @commands.has_permissions(administrator=True)
     async def ai_roles(self, ctx):
@@ -0,0 +1,135 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import List, Dict
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+
+
+class EmbeddingCache:
+    """Cache de embeddings de consultas en dos niveles: LRU en memoria + tabla en Postgres"""
+
+    def __init__(self):
+        self.memory_size = settings.CHATBOT_EMBEDDING_CACHE_MEMORY_SIZE
+        self.db_size = settings.CHATBOT_EMBEDDING_CACHE_DB_SIZE
+        self.max_age = timedelta(days=settings.CHATBOT_EMBEDDING_CACHE_MAX_AGE_DAYS)
+        self.evict_every = 100
+        self._memory: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normaliza el texto para que variaciones triviales compartan entrada"""
+        return re.sub(r'\s+', ' ', text).strip().lower()
+
+    def make_key(self, text: str, model: str, dimensions: int) -> str:
+        """Clave de cache: hash de (texto normalizado, modelo, dimensiones)"""
+        raw = f"{model}:{dimensions}:{self.normalize(text)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Devuelve contadores de aciertos/fallos y tamaño del nivel en memoria"""
+        with self._lock:
+            return {**self.stats, 'memory_entries': len(self._memory)}
+
+    async def get(self, key: str) -> List[float] | None:
+        """Busca un embedding en memoria y, si no está, en la base de datos"""
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return embedding
+
+        try:
+            embedding = await sync_to_async(self._get_from_db)(key)
+        except Exception as e:
+            print(f"⚠️ Error leyendo cache de embeddings: {e}")
+            embedding = None
+
+        with self._lock:
+            if embedding is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['db_hits'] += 1
+            self._remember(key, embedding)
+        return embedding
+
+    async def set(self, key: str, embedding: List[float], model: str, dimensions: int):
+        """Guarda un embedding en ambos niveles"""
+        with self._lock:
+            self._remember(key, embedding)
+            self._writes += 1
+            should_evict = self._writes % self.evict_every == 0
+
+        try:
+            await sync_to_async(self._save_to_db)(key, embedding, model, dimensions, should_evict)
+        except Exception as e:
+            print(f"⚠️ Error guardando cache de embeddings: {e}")
+
+    def _remember(self, key: str, embedding: List[float]):
+        """Inserta en el LRU en memoria (llamar con el lock tomado)"""
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _get_from_db(self, key: str) -> List[float] | None:
+        from .models import ChatbotEmbeddingCache
+
+        entry = ChatbotEmbeddingCache.objects.filter(
+            cache_key=key,
+            last_used_at__gte=timezone.now() - self.max_age
+        ).first()
+        if not entry:
+            return None
+
+        ChatbotEmbeddingCache.objects.filter(pk=entry.pk).update(
+            hit_count=F('hit_count') + 1,
+            last_used_at=timezone.now()
+        )
+        return [float(x) for x in entry.embedding]
+
+    def _save_to_db(self, key: str, embedding: List[float], model: str, dimensions: int, evict: bool):
+        from .models import ChatbotEmbeddingCache
+
+        ChatbotEmbeddingCache.objects.update_or_create(
+            cache_key=key,
+            defaults={
+                'embedding': embedding,
+                'embedding_model': model,
+                'dimensions': dimensions,
+                'last_used_at': timezone.now(),
+            }
+        )
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Elimina entradas viejas y recorta la tabla al tamaño máximo (por último uso)"""
+        from .models import ChatbotEmbeddingCache
+
+        deleted, _ = ChatbotEmbeddingCache.objects.filter(
+            last_used_at__lt=timezone.now() - self.max_age
+        ).delete()
+
+        stale_ids = list(
+            ChatbotEmbeddingCache.objects.order_by('-last_used_at')
+            .values_list('id', flat=True)[self.db_size:]
+        )
+        if stale_ids:
+            extra, _ = ChatbotEmbeddingCache.objects.filter(id__in=stale_ids).delete()
+            deleted += extra
+
+        if deleted:
+            print(f"🧹 Cache de embeddings: {deleted} entradas eliminadas")
+        return deleted
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,24 @@
+from django.db.models import F
+
+
+def get_generation(name: str) -> int:
+    """Generación vigente de un cache compartido (0 si nunca se invalidó)"""
+    from .models import ChatbotCacheGeneration
+
+    return ChatbotCacheGeneration.objects.filter(name=name).values_list('generation', flat=True).first() or 0
+
+
+def set_generation(name: str, value: int) -> None:
+    """Fija el valor de un contador (p. ej. las dimensiones del índice de prefijo construido)"""
+    from .models import ChatbotCacheGeneration
+
+    ChatbotCacheGeneration.objects.update_or_create(name=name, defaults={'generation': value})
+
+
+def bump_generation(name: str) -> None:
+    """Marca un cache como obsoleto en todos los procesos"""
+    from .models import ChatbotCacheGeneration
+
+    updated = ChatbotCacheGeneration.objects.filter(name=name).update(generation=F('generation') + 1)
+    if not updated:
+        ChatbotCacheGeneration.objects.get_or_create(name=name, defaults={'generation': 1})
@@ -0,0 +1,107 @@
+import os
+import asyncio
+import aiohttp
+from django.conf import settings
+
+
+def openai_url(path: str) -> str:
+    """URL de un endpoint de OpenAI; OPENAI_API_BASE permite apuntar a un stub local"""
+    base = os.environ.get('OPENAI_API_BASE', 'https://api.openai.com/v1').rstrip('/')
+    return f"{base}/{path.lstrip('/')}"
+
+
+class OpenAIAPIError(Exception):
+    """Respuesta de error de la API de OpenAI (conserva el status y el Retry-After)"""
+
+    def __init__(self, status: int, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def is_retryable(self) -> bool:
+        return self.status == 429 or self.status >= 500
+
+    @classmethod
+    async def from_response(cls, response: aiohttp.ClientResponse, prefix: str = 'OpenAI API error') -> 'OpenAIAPIError':
+        error_text = await response.text()
+        return cls(response.status, f"{prefix} {response.status}: {error_text}", parse_retry_after(response.headers))
+
+
+def parse_retry_after(headers) -> float | None:
+    """Segundos a esperar según retry-after-ms / Retry-After (None si no vienen)"""
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('Retry-After'):
+            return float(headers['Retry-After'])
+    except ValueError:
+        pass
+    return None
+
+
+class OpenAIHttpClient:
+    """Pool HTTP compartido (keep-alive) para todo el tráfico hacia OpenAI"""
+
+    def __init__(self):
+        self.connection_limit = settings.CHATBOT_HTTP_POOL_LIMIT
+        self.dns_cache_ttl = 300
+        self.keepalive_timeout = 60
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Devuelve la sesión del proceso, creándola en el event loop actual si hace falta"""
+        loop = asyncio.get_running_loop()
+
+        # async_to_sync (comandos de manage.py) puede ejecutar cada llamada en otro loop;
+        # una sesión aiohttp solo sirve en el loop donde se creó
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._discard()
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+
+        return self._session
+
+    async def close(self):
+        """Cierra el pool (al apagar el bot o terminar un comando)"""
+        if self._session and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+            self._session = None
+            self._loop = None
+        else:
+            self._discard()
+
+    def _discard(self):
+        """Suelta la sesión de otro event loop sin filtrar sus conexiones
+
+        Una sesión aiohttp solo puede cerrarse en el loop donde se creó: si sigue vivo
+        se le encarga el cierre; si ya terminó, se desacopla el connector y se cierran
+        sus sockets directamente.
+        """
+        session, loop = self._session, self._loop
+        self._session = None
+        self._loop = None
+        if session is None or session.closed:
+            return
+
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            try:
+                connector.close()
+            except RuntimeError as e:
+                # Loop cerrado: los transports ya no pueden programar su cierre
+                print(f"⚠️ Pool HTTP de un event loop cerrado descartado: {e}")
+
+
+openai_http = OpenAIHttpClient()
@@ -0,0 +1,358 @@
+import time
+import random
+import asyncio
+import threading
+from collections import defaultdict
+from typing import List, Dict
+import aiohttp
+from django.conf import settings
+from django.db import transaction
+from .chunking import hamming_distance
+from .http_client import OpenAIAPIError
+
+
+class RateBudget:
+    """Token bucket por minuto (tokens o requests) compartido entre las tareas concurrentes"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(per_minute, 1)
+        self.rate = self.capacity / 60
+        self._available = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int):
+        """Espera hasta que haya presupuesto para `amount` unidades y las consume"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                await asyncio.sleep((amount - self._available) / self.rate)
+
+
+class EmbeddingScheduler:
+    """Genera embeddings con concurrencia acotada, lotes empaquetados por tokens y presupuesto TPM/RPM
+
+    Los 429/5xx se reintentan respetando Retry-After (o backoff exponencial con
+    jitter); mientras dura la espera se pausan todas las tareas, no solo la que falló.
+    """
+
+    max_batch_inputs = 2048
+    max_batch_tokens = 300_000
+
+    def __init__(
+        self,
+        concurrency: int | None = None,
+        tokens_per_minute: int | None = None,
+        requests_per_minute: int | None = None,
+        max_retries: int = 6
+    ):
+        self.concurrency = max(concurrency or settings.CHATBOT_EMBEDDING_CONCURRENCY, 1)
+        self.tokens = RateBudget(tokens_per_minute or settings.CHATBOT_EMBEDDING_TPM)
+        self.requests = RateBudget(requests_per_minute or settings.CHATBOT_EMBEDDING_RPM)
+        self.max_retries = max_retries
+        self.base_delay = 1.0
+        self.max_delay = 60.0
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._paused_until = 0.0
+        self.stats = {'requests': 0, 'inputs': 0, 'tokens': 0, 'retries': 0}
+
+    def pack_batches(self, items: List[Dict]) -> List[List[int]]:
+        """Agrupa índices de `items` ({'text', 'tokens'}) respetando los límites por request"""
+        token_limit = min(self.max_batch_tokens, self.tokens.capacity)
+        batches, current, current_tokens = [], [], 0
+        for i, item in enumerate(items):
+            if current and (len(current) >= self.max_batch_inputs or current_tokens + item['tokens'] > token_limit):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += item['tokens']
+        if current:
+            batches.append(current)
+        return batches
+
+    async def embed(self, items: List[Dict]) -> List[List[float]]:
+        """Embeddings de `items` en el mismo orden (los lotes se envían en paralelo)"""
+        batches = self.pack_batches(items)
+        batch_embeddings = await asyncio.gather(*(self._embed_batch([items[i] for i in batch]) for batch in batches))
+
+        # _embed_batch garantiza un embedding por input: cada índice queda cubierto exactamente una vez
+        by_index: Dict[int, List[float]] = {}
+        for batch, embeddings in zip(batches, batch_embeddings):
+            by_index.update(zip(batch, embeddings))
+        return [by_index[i] for i in range(len(items))]
+
+    async def _embed_batch(self, batch: List[Dict]) -> List[List[float]]:
+        from .vector_service import vector_service
+
+        batch_tokens = sum(item['tokens'] for item in batch)
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self._wait_if_paused()
+                await self.requests.acquire(1)
+                await self.tokens.acquire(batch_tokens)
+                try:
+                    embeddings = await vector_service.create_embeddings_batch([item['text'] for item in batch])
+                    if len(embeddings) != len(batch):
+                        raise OpenAIAPIError(502, f"OpenAI devolvió {len(embeddings)} embeddings para {len(batch)} inputs")
+                    self.stats['requests'] += 1
+                    self.stats['inputs'] += len(batch)
+                    self.stats['tokens'] += batch_tokens
+                    return embeddings
+                except OpenAIAPIError as e:
+                    if not e.is_retryable or attempt == self.max_retries:
+                        raise
+                    delay = e.retry_after if e.retry_after is not None else self._backoff(attempt)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+
+                self.stats['retries'] += 1
+                # Jitter para que las tareas pausadas no reintenten todas a la vez
+                self._paused_until = max(self._paused_until, time.monotonic() + delay + random.uniform(0, delay * 0.25))
+
+        # El último intento siempre relanza; explícito para que ningún camino devuelva None
+        raise OpenAIAPIError(0, f"Sin embeddings tras {self.max_retries + 1} intentos")
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _wait_if_paused(self):
+        delay = self._paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._paused_until - time.monotonic()
+
+
+class NearDuplicateIndex:
+    """Índice SimHash en memoria de los chunks ya guardados
+
+    Las huellas se parten en `max_distance + 1` bandas: dos huellas a distancia de
+    Hamming <= max_distance coinciden por completo en al menos una banda, así que
+    solo se comparan los chunks que comparten bucket con la consulta.
+    """
+
+    def __init__(self, max_distance: int | None = None):
+        self.max_distance = settings.CHATBOT_DEDUP_MAX_DISTANCE if max_distance is None else max_distance
+        self.bands = max(self.max_distance, 0) + 1
+        self.band_bits = 64 // self.bands
+        self._buckets = defaultdict(set)
+        self._records: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_distance >= 0
+
+    @classmethod
+    def load(cls) -> 'NearDuplicateIndex':
+        """Carga las huellas de todos los chunks (llamar desde un hilo)"""
+        from .models import ChatbotKnowledgeChunk
+
+        index = cls()
+        if index.enabled:
+            rows = ChatbotKnowledgeChunk.objects.filter(simhash__isnull=False).values_list(
+                'id', 'simhash', 'course', 'source_file'
+            )
+            for chunk_id, fingerprint, course, source_file in rows.iterator(chunk_size=2000):
+                index.add(chunk_id, fingerprint, course, source_file)
+        return index
+
+    def _keys(self, fingerprint: int):
+        unsigned = fingerprint & 0xFFFFFFFFFFFFFFFF
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield band, (unsigned >> (band * self.band_bits)) & mask
+
+    def add(self, chunk_id: int, fingerprint: int | None, course: str, source_file: str):
+        if not self.enabled or fingerprint is None:
+            return
+        with self._lock:
+            self._records[chunk_id] = (fingerprint, course, source_file)
+            for key in self._keys(fingerprint):
+                self._buckets[key].add(chunk_id)
+
+    def discard(self, chunk_id: int):
+        with self._lock:
+            record = self._records.pop(chunk_id, None)
+            if record:
+                for key in self._keys(record[0]):
+                    self._buckets[key].discard(chunk_id)
+
+    def move(self, chunk_id: int, course: str, source_file: str):
+        """Actualiza el archivo al que pertenece un chunk (tras promover un duplicado)"""
+        with self._lock:
+            if chunk_id in self._records:
+                self._records[chunk_id] = (self._records[chunk_id][0], course, source_file)
+
+    def find(self, fingerprint: int | None, course: str, exclude_source_file: str | None = None) -> int | None:
+        """Id del chunk más parecido de otro archivo del mismo curso dentro de max_distance, o None
+
+        Nunca se colapsa entre cursos: la búsqueda filtra por `course`, así que un chunk de
+        imax_pro guardado solo en duplicate_sources de uno de imax_launch sería invisible
+        para los roles que solo consultan imax_pro.
+        """
+        if not self.enabled or fingerprint is None:
+            return None
+        best_id, best_distance = None, self.max_distance + 1
+        with self._lock:
+            candidates = set().union(*(self._buckets.get(key, ()) for key in self._keys(fingerprint)))
+            for chunk_id in candidates:
+                other, other_course, source_file = self._records[chunk_id]
+                if other_course != course or source_file == exclude_source_file:
+                    continue
+                distance = hamming_distance(fingerprint, other)
+                if distance < best_distance:
+                    best_id, best_distance = chunk_id, distance
+        return best_id
+
+
+def release_chunks(chunk_ids: List[int], dedup_index: NearDuplicateIndex | None = None) -> int:
+    """Elimina chunks; los que representan a duplicados de otros archivos se reasignan al primero de ellos
+
+    Así borrar o modificar el archivo "original" no deja sin contenido a sus copias.
+    Devuelve cuántos chunks se eliminaron de verdad (llamar dentro de una transacción).
+    """
+    from .models import ChatbotKnowledgeChunk
+
+    if not chunk_ids:
+        return 0
+
+    promoted = []
+    for chunk in ChatbotKnowledgeChunk.objects.filter(id__in=chunk_ids).exclude(duplicate_sources=[]):
+        heir, *rest = chunk.duplicate_sources
+        chunk.course = heir['course']
+        chunk.source_file = heir['source_file']
+        chunk.module = heir.get('module', chunk.module)
+        chunk.chunk_index = heir['chunk_index']
+        chunk.duplicate_sources = rest
+        promoted.append(chunk)
+
+    if promoted:
+        ChatbotKnowledgeChunk.objects.bulk_update(
+            promoted, ['course', 'source_file', 'module', 'chunk_index', 'duplicate_sources']
+        )
+
+    promoted_ids = {chunk.id for chunk in promoted}
+    deleted_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in promoted_ids]
+    deleted = ChatbotKnowledgeChunk.objects.filter(id__in=deleted_ids).delete()[0]
+
+    if dedup_index:
+        for chunk in promoted:
+            dedup_index.move(chunk.id, chunk.course, chunk.source_file)
+        for chunk_id in deleted_ids:
+            dedup_index.discard(chunk_id)
+    return deleted
+
+
+def forget_duplicate_references(course: str, source_file: str):
+    """Quita un archivo de las listas duplicate_sources (antes de reindexarlo o al eliminarlo)"""
+    from .models import ChatbotKnowledgeChunk
+
+    chunks = list(ChatbotKnowledgeChunk.objects.filter(
+        duplicate_sources__contains=[{'course': course, 'source_file': source_file}]
+    ))
+    for chunk in chunks:
+        chunk.duplicate_sources = [
+            ref for ref in chunk.duplicate_sources
+            if (ref['course'], ref['source_file']) != (course, source_file)
+        ]
+    if chunks:
+        ChatbotKnowledgeChunk.objects.bulk_update(chunks, ['duplicate_sources'])
+
+
+def remove_source(course: str, source_file: str, dedup_index: NearDuplicateIndex | None = None) -> int:
+    """Elimina del índice un archivo que ya no existe en disco"""
+    from .models import ChatbotKnowledgeChunk, ChatbotKnowledgeSource
+
+    with transaction.atomic():
+        forget_duplicate_references(course, source_file)
+        chunk_ids = list(ChatbotKnowledgeChunk.objects.filter(course=course, source_file=source_file).values_list('id', flat=True))
+        deleted = release_chunks(chunk_ids, dedup_index)
+        ChatbotKnowledgeSource.objects.filter(course=course, source_file=source_file).delete()
+    return deleted
+
+
+class KnowledgeChunkWriter:
+    """Acumula los chunks de un archivo y los escribe con bulk_create en una sola transacción
+
+    Todas las escrituras del archivo (chunks obsoletos, posiciones reutilizadas,
+    chunks nuevos, referencias a duplicados y el registro ChatbotKnowledgeSource)
+    se aplican juntas: un fallo a mitad de archivo no deja el índice con una
+    mezcla de versiones.
+    """
+
+    def __init__(self, entry: Dict, batch_size: int = 500, dedup_index: NearDuplicateIndex | None = None):
+        self.entry = entry
+        self.batch_size = batch_size
+        self.dedup_index = dedup_index
+        self._pending = []
+        self._duplicates = defaultdict(list)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, chunk_index: int, chunk: Dict, embedding: List[float]):
+        """Agrega un chunk nuevo al buffer (no toca la base de datos)"""
+        from .models import ChatbotKnowledgeChunk
+
+        self._pending.append(ChatbotKnowledgeChunk(
+            content=chunk['text'],
+            embedding=embedding,
+            embedding_half=embedding,
+            source_file=self.entry['source_file'],
+            course=self.entry['course'],
+            module=self.entry['module'],
+            chunk_index=chunk_index,
+            token_count=chunk['tokens'],
+            content_hash=chunk['hash'],
+            simhash=chunk.get('simhash'),
+        ))
+
+    def add_duplicate(self, canonical_id: int, chunk_index: int):
+        """Registra un chunk casi idéntico a `canonical_id`: no se guarda, solo se referencia"""
+        self._duplicates[canonical_id].append({
+            'course': self.entry['course'],
+            'source_file': self.entry['source_file'],
+            'module': self.entry['module'],
+            'chunk_index': chunk_index,
+        })
+
+    def commit(self, chunk_count: int, reused: List = (), stale_ids: List[int] = ()) -> int:
+        """Aplica los cambios del archivo (llamar desde un hilo: es código síncrono)"""
+        from .models import ChatbotKnowledgeChunk, ChatbotKnowledgeSource
+
+        course, source_file = self.entry['course'], self.entry['source_file']
+        with transaction.atomic():
+            forget_duplicate_references(course, source_file)
+            release_chunks(list(stale_ids), self.dedup_index)
+            if reused:
+                ChatbotKnowledgeChunk.objects.bulk_update(
+                    reused, ['chunk_index', 'module', 'content_hash', 'simhash'], batch_size=self.batch_size
+                )
+            created = ChatbotKnowledgeChunk.objects.bulk_create(self._pending, batch_size=self.batch_size)
+
+            canonicals = list(ChatbotKnowledgeChunk.objects.select_for_update().filter(id__in=list(self._duplicates)))
+            for canonical in canonicals:
+                canonical.duplicate_sources = canonical.duplicate_sources + self._duplicates[canonical.id]
+            ChatbotKnowledgeChunk.objects.bulk_update(canonicals, ['duplicate_sources'])
+
+            ChatbotKnowledgeSource.objects.update_or_create(
+                course=course,
+                source_file=source_file,
+                defaults={'content_hash': self.entry['content_hash'], 'chunk_count': chunk_count},
+            )
+
+        if self.dedup_index:
+            for chunk in list(created) + list(reused):
+                self.dedup_index.add(chunk.id, chunk.simhash, course, source_file)
+
+        self._pending = []
+        self._duplicates = defaultdict(list)
+        return len(created)
@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Cast
+from pgvector.django import HalfVectorField
+
+
+class Command(BaseCommand):
+    help = 'Rellena embedding_half (copia half-precision) y mide el recall frente a la búsqueda exacta'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--measure-recall',
+            type=int,
+            default=0,
+            metavar='N',
+            help='Mide recall@k con las N primeras preguntas del conjunto de benchmark_rag',
+        )
+        parser.add_argument(
+            '--queries',
+            default=None,
+            help='JSON de preguntas (por defecto el de benchmark_rag)',
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=5,
+            help='Tamaño del top-k para medir recall (por defecto 5)',
+        )
+
+    def handle(self, *args, **options):
+        from chatbot_ai.models import ChatbotKnowledgeChunk
+
+        updated = ChatbotKnowledgeChunk.objects.filter(embedding_half__isnull=True).update(
+            embedding_half=Cast('embedding', HalfVectorField(dimensions=1536))
+        )
+        self.stdout.write(self.style.SUCCESS(f'[OK] {updated} chunks con embedding_half rellenado'))
+
+        if options['measure_recall']:
+            self._measure_recall(options['measure_recall'], options['k'], options['queries'])
+
+    def _measure_recall(self, sample_size: int, k: int, queries_path: str | None):
+        """Compara el top-k de la búsqueda halfvec + re-ranking con el top-k exacto
+
+        Las consultas son preguntas reales: con el embedding de un chunk guardado como
+        consulta, ese mismo chunk queda a distancia 0 y el recall sale inflado.
+        """
+        from chatbot_ai.vector_service import vector_service
+        from chatbot_ai.management.commands.benchmark_rag import DEFAULT_QUERIES
+
+        questions = [q['question'] for q in json.loads(Path(queries_path or DEFAULT_QUERIES).read_text(encoding='utf-8'))]
+        sample = async_to_sync(self._embed_questions)(questions[:sample_size])
+        if not sample:
+            self.stdout.write(self.style.WARNING('[WARN] No hay preguntas para medir recall'))
+            return
+
+        total_recall = 0.0
+        for query in sample:
+            exact = {c['id'] for c in vector_service._search_exact(query, k, None)}
+            approx = {c['id'] for c in vector_service._search_pgvector(query, k, None, first_pass='halfvec')}
+            total_recall += len(exact & approx) / max(len(exact), 1)
+
+        recall = total_recall / len(sample)
+        self.stdout.write(f'[INFO] recall@{k} halfvec vs exacto: {recall:.3f} ({len(sample)} consultas)')
+
+    async def _embed_questions(self, questions: list) -> list:
+        from chatbot_ai.http_client import openai_http
+        from chatbot_ai.vector_service import vector_service
+
+        try:
+            return [await vector_service.create_embedding(question) for question in questions]
+        finally:
+            await openai_http.close()
@@ -0,0 +1,164 @@
+import json
+import time
+import unicodedata
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from asgiref.sync import async_to_sync, sync_to_async
+
+
+DEFAULT_QUERIES = Path(__file__).resolve().parent.parent.parent / 'benchmarks' / 'rag_queries.json'
+
+
+def _normalize(name: str) -> str:
+    """Los nombres de archivo pueden venir en NFD (macOS) o NFC"""
+    return unicodedata.normalize('NFC', name or '')
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    """Percentil por rango más cercano"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(percent / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Command(BaseCommand):
+    help = 'Mide recall@k, MRR y latencia (p50/p95/p99) de la búsqueda RAG por backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries',
+            default=str(DEFAULT_QUERIES),
+            help='JSON con [{"question": ..., "expected": [{"source_file": ..., "chunk_index": opcional}]}]',
+        )
+        parser.add_argument(
+            '--backends',
+            default='exact,halfvec,prefix,hybrid,memory',
+            help='Backends a comparar, separados por comas',
+        )
+        parser.add_argument('--k', type=int, default=5, help='Tamaño del top-k')
+        parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por consulta para la latencia')
+        parser.add_argument('--output', help='Archivo donde guardar el resultado JSON (por defecto stdout)')
+
+    def handle(self, *args, **options):
+        async_to_sync(self._handle_async)(**options)
+
+    async def _handle_async(self, **options):
+        from chatbot_ai.http_client import openai_http
+
+        try:
+            await self._run(**options)
+        finally:
+            await openai_http.close()
+
+    async def _run(self, **options):
+        from chatbot_ai.vector_service import vector_service
+        from chatbot_ai.ai_service import ai_service
+        from chatbot_ai.prompt_registry import prompt_registry
+
+        queries = json.loads(Path(options['queries']).read_text(encoding='utf-8'))
+        backends = [b.strip() for b in options['backends'].split(',') if b.strip()]
+        k = options['k']
+
+        # Los embeddings se calculan una vez: la latencia medida es solo la de recuperación
+        embeddings = [await vector_service.create_embedding(q['question']) for q in queries]
+        # Carga rag_hnsw_ef_search como lo haría el bot
+        await prompt_registry.get(ai_service._get_default_system_prompt())
+
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'k': k,
+            'queries': len(queries),
+            'repeat': options['repeat'],
+            'settings': {
+                'hnsw_indexes': await sync_to_async(self._hnsw_build_options)(),
+                'ef_search': vector_service._get_ef_search(k),
+                'rerank_candidates_factor': vector_service.rerank_candidates_factor,
+                'prefix_dimensions': await sync_to_async(vector_service._get_prefix_dimensions)(),
+            },
+            'backends': {},
+        }
+
+        for backend in backends:
+            self.stderr.write(f'Midiendo {backend}...')
+            report['backends'][backend] = await self._benchmark_backend(backend, queries, embeddings, k, options['repeat'])
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output + '\n', encoding='utf-8')
+            self.stderr.write(self.style.SUCCESS(f'[SUCCESS] Resultados guardados en {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    async def _benchmark_backend(self, backend: str, queries: list, embeddings: list, k: int, repeat: int) -> dict:
+        from chatbot_ai.vector_service import vector_service
+
+        latencies = []
+        recall_sum = 0.0
+        reciprocal_rank_sum = 0.0
+
+        try:
+            for query, embedding in zip(queries, embeddings):
+                results = []
+                for _ in range(max(repeat, 1)):
+                    started = time.perf_counter()
+                    # strict: un fallo del backend debe verse como error, no como recall 0
+                    results = await vector_service.search_by_embedding(
+                        query['question'], embedding, k, None, backend, strict=True
+                    )
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+                expected = query.get('expected', [])
+                matched = [
+                    any(self._is_match(hit, item) for hit in results)
+                    for item in expected
+                ]
+                recall_sum += sum(matched) / len(expected) if expected else 0.0
+
+                for rank, hit in enumerate(results, 1):
+                    if any(self._is_match(hit, item) for item in expected):
+                        reciprocal_rank_sum += 1 / rank
+                        break
+        except Exception as e:
+            return {'error': str(e)[:200]}
+
+        latencies.sort()
+        total = len(queries) or 1
+        return {
+            f'recall_at_{k}': round(recall_sum / total, 4),
+            'mrr': round(reciprocal_rank_sum / total, 4),
+            'latency_ms': {
+                'p50': round(_percentile(latencies, 50), 3),
+                'p95': round(_percentile(latencies, 95), 3),
+                'p99': round(_percentile(latencies, 99), 3),
+                'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            },
+        }
+
+    def _hnsw_build_options(self) -> dict:
+        """m / ef_construction con los que se construyó cada índice HNSW (pueden diferir de las migraciones)"""
+        from django.db import connection
+        from chatbot_ai.models import ChatbotKnowledgeChunk
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname, c.reloptions FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_am am ON am.oid = c.relam "
+                "WHERE i.indrelid = %s::regclass AND am.amname = 'hnsw' ORDER BY c.relname",
+                [ChatbotKnowledgeChunk._meta.db_table]
+            )
+            return {name: dict(option.split('=', 1) for option in options or []) for name, options in cursor.fetchall()}
+
+    def _is_match(self, hit: dict, expected: dict) -> bool:
+        """El hit o alguno de los casi-duplicados fusionados en él es el chunk esperado"""
+        return any(
+            self._same_chunk(source, expected)
+            for source in [hit, *(hit.get('duplicate_sources') or [])]
+        )
+
+    def _same_chunk(self, source: dict, expected: dict) -> bool:
+        if _normalize(source.get('source_file')) != _normalize(expected.get('source_file')):
+            return False
+        return expected.get('chunk_index') is None or source.get('chunk_index') == expected['chunk_index']
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = 'Crea los índices HNSW sobre el prefijo del embedding (búsqueda Matryoshka en dos pasos)'
+
+    def add_arguments(self, parser):
+        from chatbot_ai.models import HNSW_M, HNSW_EF_CONSTRUCTION
+
+        parser.add_argument(
+            '--dimensions',
+            type=int,
+            default=settings.CHATBOT_EMBEDDING_PREFIX_DIMENSIONS,
+            help='Dimensiones del prefijo (por defecto CHATBOT_EMBEDDING_PREFIX_DIMENSIONS)',
+        )
+        parser.add_argument('--m', type=int, default=HNSW_M, help=f'Conexiones por nodo (por defecto {HNSW_M})')
+        parser.add_argument(
+            '--ef-construction',
+            type=int,
+            default=HNSW_EF_CONSTRUCTION,
+            help=f'Tamaño de la lista de candidatos al construir (por defecto {HNSW_EF_CONSTRUCTION})',
+        )
+        parser.add_argument(
+            '--keep-old',
+            action='store_true',
+            help='No elimina los índices de prefijo de otras dimensiones',
+        )
+
+    def handle(self, *args, **options):
+        from chatbot_ai.models import ChatbotKnowledgeChunk
+        from chatbot_ai.generations import set_generation
+        from chatbot_ai.vector_service import PREFIX_INDEX_GENERATION
+        
+        dims = options['dimensions']
+        full_dims = ChatbotKnowledgeChunk._meta.get_field('embedding').dimensions
+        if not 0 < dims < full_dims:
+            self.stderr.write(self.style.ERROR(f'Las dimensiones deben estar entre 1 y {full_dims - 1}'))
+            return
+        
+        table = ChatbotKnowledgeChunk._meta.db_table
+        # Global + uno parcial por curso (como chatbot_chunk_half_<curso>_hnsw): una búsqueda
+        # filtrada por curso no post-filtra el índice global ni se queda corta de filas
+        indexes = {f'chatbot_chunk_prefix_{dims}_hnsw': ''}
+        for course, _ in ChatbotKnowledgeChunk.COURSE_CHOICES:
+            suffix = course.rsplit('_', 1)[-1]
+            indexes[f'chatbot_chunk_prefix_{dims}_{suffix}_hnsw'] = f" WHERE course = '{course}'"
+        
+        with connection.cursor() as cursor:
+            for index_name, condition in indexes.items():
+                # La expresión debe ser idéntica a VectorService._prefix_expression para que se use el índice
+                self.stdout.write(f'Creando {index_name}...')
+                cursor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table} '
+                    f'USING hnsw ((subvector(embedding, 1, {dims})::vector({dims})) vector_cosine_ops) '
+                    f'WITH (m = {int(options["m"])}, ef_construction = {int(options["ef_construction"])})'
+                    f'{condition}'
+                )
+            
+            # Las búsquedas usan la dimensión registrada aquí, no la del entorno de cada proceso
+            set_generation(PREFIX_INDEX_GENERATION, dims)
+            
+            if not options['keep_old']:
+                cursor.execute(
+                    "SELECT indexname FROM pg_indexes WHERE tablename = %s "
+                    "AND indexname LIKE 'chatbot_chunk_prefix_%%_hnsw' AND NOT (indexname = ANY(%s))",
+                    [table, list(indexes)]
+                )
+                for (old_index,) in cursor.fetchall():
+                    cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {old_index}')
+                    self.stdout.write(f'  [INFO] Eliminado índice anterior: {old_index}')
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'[SUCCESS] {len(indexes)} índices de prefijo ({dims} dimensiones) listos; '
+            'los procesos del bot los usan en menos de un minuto'
+        ))
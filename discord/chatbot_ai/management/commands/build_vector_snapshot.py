@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Genera el snapshot .npy de embeddings usado por el backend de búsqueda en memoria'
+
+    def handle(self, *args, **options):
+        from chatbot_ai.memory_index import memory_index
+        
+        generation = memory_index.build_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f'[SUCCESS] Snapshot {generation} escrito en {memory_index.snapshot_dir}'
+        ))
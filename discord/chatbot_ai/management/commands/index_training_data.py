@@ -1,10 +1,13 @@
 import os
 import re
 import asyncio
+import hashlib
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from asgiref.sync import async_to_sync
-import tiktoken
+from chatbot_ai.chunking import split_into_chunks, hash_text, simhash
 
 
 class Command(BaseCommand):
@@ -12,7 +15,6 @@ class Command(BaseCommand):
     
     def __init__(self):
         super().__init__()
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
         self.chunk_size = 500
         self.chunk_overlap = 50
     
@@ -20,20 +22,41 @@ class Command(BaseCommand):
         parser.add_argument(
             '--clear',
             action='store_true',
-            help='Elimina todos los chunks existentes antes de indexar',
+            help='Elimina todos los chunks existentes y reindexa todo desde cero',
         )
         parser.add_argument(
             '--dry-run',
             action='store_true',
-            help='Muestra qué se indexaría sin hacer cambios',
+            help='Muestra el plan de cambios sin aplicarlo',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.CHATBOT_EMBEDDING_CONCURRENCY,
+            help='Requests de embeddings simultáneos (el ritmo lo limitan CHATBOT_EMBEDDING_TPM/RPM)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Procesos para tokenizar y dividir en chunks (por defecto, uno por CPU)',
         )
     
     def handle(self, *args, **options):
         async_to_sync(self._handle_async)(*args, **options)
     
     async def _handle_async(self, *args, **options):
-        from chatbot_ai.models import ChatbotKnowledgeChunk
-        from chatbot_ai.vector_service import vector_service
+        from chatbot_ai.http_client import openai_http
+        
+        try:
+            await self._index(**options)
+        finally:
+            await openai_http.close()
+    
+    async def _index(self, **options):
+        from chatbot_ai.models import ChatbotKnowledgeChunk, ChatbotKnowledgeSource
+        from chatbot_ai.answer_cache import invalidate_answer_cache
+        from chatbot_ai.ingestion import EmbeddingScheduler, NearDuplicateIndex
         
         training_dir = Path(__file__).parent.parent.parent / 'ai-training'
         
@@ -41,83 +64,312 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f'Directorio no encontrado: {training_dir}'))
             return
         
-        if options['clear'] and not options['dry_run']:
-            count = await asyncio.to_thread(ChatbotKnowledgeChunk.objects.all().delete)
-            self.stdout.write(self.style.WARNING(f'[INFO] Eliminados {count[0]} chunks existentes'))
+        files = await asyncio.to_thread(self._scan_files, training_dir)
+        self.stdout.write(f'Encontrados {len(files)} archivos .txt')
         
-        txt_files = list(training_dir.rglob('*.txt'))
-        self.stdout.write(f'Encontrados {len(txt_files)} archivos .txt')
+        plan = await asyncio.to_thread(self._build_plan, files, options['clear'])
+        self._print_plan(plan)
         
         if options['dry_run']:
-            self._dry_run_report(txt_files, training_dir)
+            self._dry_run_report([f['path'] for f in plan['new'] + plan['changed']], training_dir)
             return
         
-        total_chunks = 0
-        total_tokens = 0
+        if options['clear']:
+            count = await asyncio.to_thread(ChatbotKnowledgeChunk.objects.all().delete)
+            await asyncio.to_thread(ChatbotKnowledgeSource.objects.all().delete)
+            self.stdout.write(self.style.WARNING(f'[INFO] Eliminados {count[0]} chunks existentes'))
         
-        for file_path in txt_files:
-            try:
-                course = self._detect_course(file_path, training_dir)
-                module = self._extract_module(file_path.name)
-                
-                try:
-                    content = file_path.read_text(encoding='utf-8')
-                except UnicodeDecodeError:
-                    try:
-                        content = file_path.read_text(encoding='utf-8-sig')
-                    except:
-                        try:
-                            content = file_path.read_text(encoding='latin-1')
-                        except:
-                            self.stdout.write(f'  [SKIP] No se pudo leer: {file_path.name.encode("ascii", "ignore").decode("ascii")}')
-                            continue
-                
-                if not content or not content.strip():
-                    continue
-                    
-                chunks = self._split_into_chunks(content)
-                
-                if not chunks:
-                    self.stdout.write(f'  [WARN] Sin contenido: {file_path.name}')
-                    continue
-                
-                chunk_texts = [c['text'] for c in chunks]
-                
-                safe_name = file_path.name.encode('ascii', 'ignore').decode('ascii')
-                self.stdout.write(f'  [OK] {safe_name}: {len(chunks)} chunks')
-                
-                batch_size = 20
-                for i in range(0, len(chunk_texts), batch_size):
-                    batch = chunk_texts[i:i+batch_size]
-                    embeddings = await vector_service.create_embeddings_batch(batch)
-                    
-                    for j, embedding in enumerate(embeddings):
-                        chunk_data = chunks[i + j]
-                        safe_filename = file_path.name.encode('utf-8', 'replace').decode('utf-8', 'replace')
-                        await asyncio.to_thread(
-                            ChatbotKnowledgeChunk.objects.create,
-                            content=chunk_data['text'],
-                            embedding=embedding,
-                            source_file=safe_filename,
-                            course=course,
-                            module=module,
-                            chunk_index=i + j,
-                            token_count=chunk_data['tokens']
-                        )
-                        total_tokens += chunk_data['tokens']
-                    
-                    total_chunks += len(batch)
-                
-            except Exception as e:
-                safe_name = file_path.name.encode('ascii', 'ignore').decode('ascii')
-                self.stderr.write(self.style.ERROR(f'  [ERROR] Error en {safe_name}: {str(e)[:100]}'))
+        stats = {'embedded': 0, 'reused': 0, 'duplicates': 0, 'deleted': 0, 'tokens': 0}
+        scheduler = EmbeddingScheduler(concurrency=options['concurrency'])
+        workers = options['workers'] or os.cpu_count() or 1
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            await self._backfill_simhashes(pool)
+            dedup_index = await asyncio.to_thread(NearDuplicateIndex.load)
+            await self._run_pipeline(plan['new'] + plan['changed'], pool, workers, scheduler, dedup_index, stats)
+        
+        if plan['removed']:
+            stats['deleted'] += await asyncio.to_thread(self._delete_sources, plan['removed'], dedup_index)
+        
+        if stats['embedded'] or stats['deleted'] or options['clear']:
+            await asyncio.to_thread(invalidate_answer_cache)
+            
+            if settings.CHATBOT_RAG_BACKEND == 'memory':
+                from chatbot_ai.memory_index import memory_index
+                await asyncio.to_thread(memory_index.build_snapshot)
         
         self.stdout.write(self.style.SUCCESS(
-            f'\n[SUCCESS] Indexacion completada: {total_chunks} chunks, ~{total_tokens} tokens'
+            f'\n[SUCCESS] Indexacion completada: {stats["embedded"]} chunks nuevos, '
+            f'{stats["reused"]} reutilizados, {stats["duplicates"]} duplicados fusionados, '
+            f'{stats["deleted"]} eliminados, ~{stats["tokens"]} tokens'
         ))
         
-        estimated_cost = (total_tokens / 1_000_000) * 0.02
+        estimated_cost = (stats['tokens'] / 1_000_000) * 0.02
         self.stdout.write(f'[INFO] Costo estimado de embeddings: ${estimated_cost:.4f}')
+        self.stdout.write(
+            f'[INFO] Requests de embeddings: {scheduler.stats["requests"]} '
+            f'({scheduler.stats["retries"]} reintentos)'
+        )
+    
+    def _discover(self, training_dir: Path):
+        """Recorre el directorio de entrenamiento de forma perezosa"""
+        for file_path in training_dir.rglob('*.txt'):
+            with open(file_path, 'rb') as f:
+                content_hash = hashlib.file_digest(f, 'sha256').hexdigest()
+            yield {
+                'path': file_path,
+                'course': self._detect_course(file_path, training_dir),
+                'module': self._extract_module(file_path.name),
+                'source_file': file_path.name.encode('utf-8', 'replace').decode('utf-8', 'replace'),
+                'content_hash': content_hash,
+            }
+    
+    def _scan_files(self, training_dir: Path) -> list:
+        """Metadatos y hash de cada archivo (el contenido se lee en streaming, sin decodificarlo)"""
+        return list(self._discover(training_dir))
+    
+    def _build_plan(self, files: list, clear: bool) -> dict:
+        """Compara los archivos en disco con lo indexado: nuevos, modificados, sin cambios y eliminados"""
+        from chatbot_ai.models import ChatbotKnowledgeChunk, ChatbotKnowledgeSource
+        
+        plan = {'new': [], 'changed': [], 'unchanged': [], 'removed': []}
+        if clear:
+            plan['new'] = files
+            return plan
+        
+        indexed_hashes = {
+            (course, source_file): content_hash
+            for course, source_file, content_hash in ChatbotKnowledgeSource.objects.values_list(
+                'course', 'source_file', 'content_hash'
+            )
+        }
+        # Chunks indexados antes de existir ChatbotKnowledgeSource
+        indexed_keys = set(indexed_hashes) | set(
+            ChatbotKnowledgeChunk.objects.values_list('course', 'source_file').distinct()
+        )
+        
+        for entry in files:
+            key = (entry['course'], entry['source_file'])
+            if indexed_hashes.get(key) == entry['content_hash']:
+                plan['unchanged'].append(entry)
+            elif key in indexed_keys:
+                plan['changed'].append(entry)
+            else:
+                plan['new'].append(entry)
+        
+        on_disk = {(entry['course'], entry['source_file']) for entry in files}
+        plan['removed'] = sorted(indexed_keys - on_disk)
+        return plan
+    
+    def _print_plan(self, plan: dict):
+        """Muestra el diff antes de aplicarlo"""
+        self.stdout.write(f'\n📋 Plan de indexación:')
+        self.stdout.write(f'  - Nuevos: {len(plan["new"])}')
+        self.stdout.write(f'  - Modificados: {len(plan["changed"])}')
+        self.stdout.write(f'  - Sin cambios: {len(plan["unchanged"])}')
+        self.stdout.write(f'  - Eliminados: {len(plan["removed"])}')
+        
+        for marker, entries in (('+', plan['new']), ('~', plan['changed'])):
+            for entry in entries:
+                self.stdout.write(f'  [{marker}] {entry["course"]}/{entry["source_file"]}'.encode('ascii', 'ignore').decode('ascii'))
+        for course, source_file in plan['removed']:
+            self.stdout.write(f'  [-] {course}/{source_file}'.encode('ascii', 'ignore').decode('ascii'))
+        self.stdout.write('')
+    
+    def _read_text(self, file_path: Path) -> str | None:
+        """Lee el archivo probando varias codificaciones"""
+        for encoding in ('utf-8', 'utf-8-sig', 'latin-1'):
+            try:
+                return file_path.read_text(encoding=encoding)
+            except UnicodeDecodeError:
+                continue
+        return None
+    
+    async def _run_pipeline(self, entries: list, pool: ProcessPoolExecutor, workers: int, scheduler, dedup_index, stats: dict):
+        """Decodificación → chunking (pool de procesos) → embeddings → escritura en la base de datos
+        
+        Las etapas se comunican por colas acotadas, así que solo unos pocos archivos
+        están en memoria a la vez sin importar el tamaño del corpus.
+        """
+        from chatbot_ai.ingestion import KnowledgeChunkWriter
+        
+        loop = asyncio.get_running_loop()
+        read_workers = 4
+        
+        pending = asyncio.Queue(maxsize=read_workers * 2)
+        decoded = asyncio.Queue(maxsize=workers * 2)
+        chunked = asyncio.Queue(maxsize=scheduler.concurrency * 2)
+        embedded = asyncio.Queue(maxsize=scheduler.concurrency * 2)
+        
+        async def discover():
+            for entry in entries:
+                await pending.put((entry,))
+            for _ in range(read_workers):
+                await pending.put(None)
+        
+        async def decode(entry: dict):
+            content = await asyncio.to_thread(self._read_text, entry['path'])
+            if content is None:
+                self.stdout.write(f'  [SKIP] No se pudo leer: {self._safe_name(entry)}')
+                return None
+            return entry, content
+        
+        async def chunk(entry: dict, content: str):
+            chunks = await loop.run_in_executor(pool, split_into_chunks, content, self.chunk_size, self.chunk_overlap)
+            return entry, chunks
+        
+        async def embed(entry: dict, chunks: list):
+            return await self._embed_file(entry, chunks, scheduler, dedup_index)
+        
+        async def write(entry: dict, chunk_count: int, reused: list, stale_ids: list, pending: list, known: dict, file_stats: dict):
+            # Única tarea de escritura: la decisión final de duplicados ve todo lo ya guardado
+            writer = KnowledgeChunkWriter(entry, dedup_index=dedup_index)
+            missing = []
+            for index, chunk in pending:
+                canonical_id = dedup_index.find(chunk['simhash'], entry['course'], exclude_source_file=entry['source_file'])
+                if canonical_id:
+                    writer.add_duplicate(canonical_id, index)
+                    file_stats['duplicates'] += 1
+                elif chunk['hash'] in known:
+                    writer.add(index, chunk, known[chunk['hash']])
+                else:
+                    missing.append((index, chunk))
+            
+            # El original del duplicado desapareció mientras tanto: hay que generar el embedding
+            if missing:
+                embeddings = await scheduler.embed([chunk for _, chunk in missing])
+                for (index, chunk), embedding in zip(missing, embeddings):
+                    writer.add(index, chunk, embedding)
+                    file_stats['embedded'] += 1
+                    file_stats['tokens'] += chunk['tokens']
+            
+            await asyncio.to_thread(writer.commit, chunk_count, reused, stale_ids)
+            for key, value in file_stats.items():
+                stats[key] += value
+            self.stdout.write(
+                f'  [OK] {self._safe_name(entry)}: {file_stats["embedded"]} nuevos, '
+                f'{file_stats["reused"]} reutilizados, {file_stats["duplicates"]} duplicados, '
+                f'{file_stats["deleted"]} eliminados'
+            )
+        
+        await asyncio.gather(
+            discover(),
+            self._stage(decode, pending, decoded, read_workers, workers),
+            self._stage(chunk, decoded, chunked, workers, scheduler.concurrency),
+            self._stage(embed, chunked, embedded, scheduler.concurrency, 1),
+            self._stage(write, embedded, None, 1, 0),
+        )
+    
+    async def _stage(self, handler, inbox: asyncio.Queue, outbox: asyncio.Queue | None, workers: int, downstream_workers: int):
+        """Ejecuta `handler` con `workers` tareas hasta recibir un None por tarea y luego avisa a la siguiente etapa
+        
+        Cada elemento es una tupla cuyo primer valor es el archivo; un error descarta
+        ese archivo sin detener el resto del pipeline.
+        """
+        async def worker():
+            while (item := await inbox.get()) is not None:
+                try:
+                    result = await handler(*item)
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f'  [ERROR] Error en {self._safe_name(item[0])}: {str(e)[:100]}'))
+                    continue
+                if outbox is not None and result is not None:
+                    await outbox.put(result)
+        
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        for _ in range(downstream_workers):
+            await outbox.put(None)
+    
+    async def _embed_file(self, entry: dict, chunks: list, scheduler, dedup_index) -> tuple:
+        """Genera embeddings solo para los chunks cuyo hash no existe ya y que no son casi-duplicados"""
+        from chatbot_ai.models import ChatbotKnowledgeChunk
+        
+        existing = await asyncio.to_thread(
+            lambda: list(
+                ChatbotKnowledgeChunk.objects
+                .filter(course=entry['course'], source_file=entry['source_file'])
+                .only('id', 'content', 'content_hash', 'chunk_index', 'module')
+            )
+        )
+        available = {}
+        for row in existing:
+            available.setdefault(row.content_hash or hash_text(row.content), []).append(row)
+        
+        # Reutiliza las filas cuyo contenido no cambió (solo se actualiza su posición)
+        reused, pending = [], []
+        for index, chunk in enumerate(chunks):
+            rows = available.get(chunk['hash'])
+            if rows:
+                row = rows.pop()
+                row.chunk_index = index
+                row.module = entry['module']
+                row.content_hash = chunk['hash']
+                row.simhash = chunk['simhash']
+                reused.append(row)
+            else:
+                pending.append((index, chunk))
+        stale_ids = [row.id for rows in available.values() for row in rows]
+        
+        # Embeddings ya calculados en otros archivos (p. ej. un archivo renombrado)
+        known = await asyncio.to_thread(self._known_embeddings, [chunk['hash'] for _, chunk in pending])
+        to_embed = list({
+            chunk['hash']: chunk for _, chunk in pending
+            if chunk['hash'] not in known
+            and not dedup_index.find(chunk['simhash'], entry['course'], exclude_source_file=entry['source_file'])
+        }.values())
+        
+        if to_embed:
+            embeddings = await scheduler.embed(to_embed)
+            for chunk, embedding in zip(to_embed, embeddings):
+                known[chunk['hash']] = embedding
+        
+        file_stats = {
+            'embedded': len(to_embed),
+            'reused': len(reused),
+            'duplicates': 0,
+            'deleted': len(stale_ids),
+            'tokens': sum(chunk['tokens'] for chunk in to_embed),
+        }
+        return entry, len(chunks), reused, stale_ids, pending, known, file_stats
+    
+    def _safe_name(self, entry: dict) -> str:
+        return entry['source_file'].encode('ascii', 'ignore').decode('ascii')
+    
+    def _known_embeddings(self, hashes: list) -> dict:
+        """Embeddings existentes en la base de datos para los hashes dados"""
+        from chatbot_ai.models import ChatbotKnowledgeChunk
+        
+        if not hashes:
+            return {}
+        rows = ChatbotKnowledgeChunk.objects.filter(content_hash__in=set(hashes)).values_list('content_hash', 'embedding')
+        return {content_hash: [float(x) for x in embedding] for content_hash, embedding in rows}
+    
+    async def _backfill_simhashes(self, pool: ProcessPoolExecutor):
+        """Calcula la huella SimHash de chunks indexados antes de la detección de duplicados"""
+        from chatbot_ai.models import ChatbotKnowledgeChunk
+        
+        rows = await asyncio.to_thread(
+            lambda: list(ChatbotKnowledgeChunk.objects.filter(simhash__isnull=True).only('id', 'content'))
+        )
+        if not rows:
+            return
+        
+        loop = asyncio.get_running_loop()
+        fingerprints = await asyncio.gather(*(loop.run_in_executor(pool, simhash, row.content) for row in rows))
+        for row, fingerprint in zip(rows, fingerprints):
+            row.simhash = fingerprint
+        await asyncio.to_thread(ChatbotKnowledgeChunk.objects.bulk_update, rows, ['simhash'], batch_size=500)
+        self.stdout.write(f'[INFO] SimHash calculado para {len(rows)} chunks existentes')
+    
+    def _delete_sources(self, keys: list, dedup_index) -> int:
+        """Elimina los chunks y registros de archivos que ya no existen en disco"""
+        from chatbot_ai.ingestion import remove_source
+        
+        deleted = 0
+        for course, source_file in keys:
+            deleted += remove_source(course, source_file, dedup_index)
+            self.stdout.write(f'  [DEL] {course}/{source_file}'.encode('ascii', 'ignore').decode('ascii'))
+        return deleted
     
     def _detect_course(self, file_path: Path, base_dir: Path) -> str:
         """Detecta el curso basado en la ruta del archivo"""
@@ -151,32 +403,8 @@ class Command(BaseCommand):
         
         return name[:50] if len(name) > 50 else name
     
-    def _split_into_chunks(self, text: str) -> list:
-        """Divide el texto en chunks con overlap"""
-        text = text.strip()
-        if not text:
-            return []
-        
-        tokens = self.tokenizer.encode(text)
-        chunks = []
-        
-        start = 0
-        while start < len(tokens):
-            end = start + self.chunk_size
-            chunk_tokens = tokens[start:end]
-            chunk_text = self.tokenizer.decode(chunk_tokens)
-            
-            chunks.append({
-                'text': chunk_text.strip(),
-                'tokens': len(chunk_tokens)
-            })
-            
-            start = end - self.chunk_overlap
-        
-        return chunks
-    
     def _dry_run_report(self, files: list, base_dir: Path):
-        """Muestra reporte de dry-run"""
+        """Muestra reporte de dry-run (solo archivos nuevos o modificados)"""
         total_size = 0
         by_course = {'imax_launch': 0, 'imax_pro': 0}
         
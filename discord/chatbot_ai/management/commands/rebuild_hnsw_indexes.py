@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from pgvector.django import HnswIndex
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los índices HNSW de ChatbotKnowledgeChunk con otros m / ef_construction (sin bloquear escrituras)'
+
+    def add_arguments(self, parser):
+        from chatbot_ai.models import HNSW_M, HNSW_EF_CONSTRUCTION
+
+        parser.add_argument(
+            '--m',
+            type=int,
+            default=HNSW_M,
+            help=f'Conexiones por nodo (por defecto {HNSW_M}, el de las migraciones)',
+        )
+        parser.add_argument(
+            '--ef-construction',
+            type=int,
+            default=HNSW_EF_CONSTRUCTION,
+            help=f'Tamaño de la lista de candidatos al construir (por defecto {HNSW_EF_CONSTRUCTION})',
+        )
+        parser.add_argument(
+            '--index',
+            action='append',
+            help='Solo este índice (se puede repetir); por defecto todos los HNSW del modelo',
+        )
+
+    def handle(self, *args, **options):
+        from chatbot_ai.models import ChatbotKnowledgeChunk
+
+        indexes = [
+            index for index in ChatbotKnowledgeChunk._meta.indexes
+            if isinstance(index, HnswIndex) and (not options['index'] or index.name in options['index'])
+        ]
+        if not indexes:
+            self.stderr.write(self.style.ERROR('No hay índices HNSW que reconstruir'))
+            return
+
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for index in indexes:
+                self._rebuild(schema_editor, ChatbotKnowledgeChunk, index, options['m'], options['ef_construction'])
+
+        self.stdout.write(self.style.SUCCESS(f'[SUCCESS] {len(indexes)} índices reconstruidos'))
+
+    def _rebuild(self, schema_editor, model, index, m: int, ef_construction: int):
+        """Crea una copia con los nuevos parámetros (CONCURRENTLY), borra la anterior y la renombra"""
+        _, args, kwargs = index.deconstruct()
+        temp_name = f"{index.name[:26]}_tmp"
+        replacement = HnswIndex(*args, **{**kwargs, 'name': temp_name, 'm': m, 'ef_construction': ef_construction})
+
+        self.stdout.write(f'Reconstruyendo {index.name} (m={m}, ef_construction={ef_construction})...')
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(temp_name)}')
+        schema_editor.execute(replacement.create_sql(model, schema_editor, concurrently=True))
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(index.name)}')
+        schema_editor.execute(
+            f'ALTER INDEX {schema_editor.quote_name(temp_name)} RENAME TO {schema_editor.quote_name(index.name)}'
+        )
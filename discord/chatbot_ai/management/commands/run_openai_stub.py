@@ -0,0 +1,34 @@
+from aiohttp import web
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Levanta un servidor local compatible con la API de OpenAI (embeddings y chat) para pruebas offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--latency-ms', type=float, default=0, help='Latencia fija por petición')
+        parser.add_argument('--jitter-ms', type=float, default=0, help='Latencia aleatoria adicional (0..jitter)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de peticiones que devuelven 500')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fracción de peticiones que devuelven 429')
+        parser.add_argument('--retry-after', type=int, default=1, help='Valor del header Retry-After en los 429')
+        parser.add_argument('--seed', type=int, default=None, help='Semilla para latencias y errores reproducibles')
+
+    def handle(self, *args, **options):
+        from chatbot_ai.openai_stub import OpenAIStub
+        
+        stub = OpenAIStub(
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            retry_after=options['retry_after'],
+            seed=options['seed'],
+        )
+        
+        base_url = f"http://{options['host']}:{options['port']}/v1"
+        self.stdout.write(self.style.SUCCESS(f'Stub de OpenAI escuchando en {base_url}'))
+        self.stdout.write(f'Configura OPENAI_API_BASE={base_url} (y cualquier OPENAI_API_KEY) para usarlo')
+        
+        web.run_app(stub.create_app(), host=options['host'], port=options['port'], print=None)
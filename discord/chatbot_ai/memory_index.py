@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+from typing import List, Dict
+import numpy as np
+from django.conf import settings
+
+
+class MemoryVectorIndex:
+    """Búsqueda vectorial en proceso sobre un snapshot .npy memory-mapped + metadatos JSON
+
+    El snapshot lo escribe build_snapshot() (comando build_vector_snapshot o
+    index_training_data). El archivo CURRENT apunta a la generación vigente; cada
+    proceso lo revisa como mucho cada `check_interval` segundos y recarga si cambió.
+    """
+
+    def __init__(self):
+        self.snapshot_dir = Path(settings.CHATBOT_VECTOR_SNAPSHOT_DIR)
+        self.check_interval = 5.0
+        self._lock = threading.Lock()
+        self._generation: str | None = None
+        self._matrix: np.ndarray | None = None
+        self._courses: np.ndarray | None = None
+        self._metadata: List[Dict] = []
+        self._last_check = 0.0
+        self._build_lock = threading.Lock()
+        self._builder: threading.Thread | None = None
+        self._rebuild_pending = False
+
+    @property
+    def generation(self) -> str | None:
+        return self._generation
+
+    def _paths(self, generation: str) -> tuple[Path, Path]:
+        return (
+            self.snapshot_dir / f'embeddings-{generation}.npy',
+            self.snapshot_dir / f'metadata-{generation}.json',
+        )
+
+    def build_snapshot(self) -> str:
+        """Vuelca los chunks de la base de datos a un nuevo snapshot y lo publica en CURRENT"""
+        from .models import ChatbotKnowledgeChunk
+
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            previous = (self.snapshot_dir / 'CURRENT').read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            previous = None
+        queryset = ChatbotKnowledgeChunk.objects.order_by('id')
+        total = queryset.count()
+        dimensions = ChatbotKnowledgeChunk._meta.get_field('embedding').dimensions
+
+        fingerprint = hashlib.sha256()
+        # Nombre único: el admin y index_training_data pueden construir a la vez
+        tmp_matrix_path = self.snapshot_dir / f'embeddings.tmp{uuid.uuid4().hex}.npy'
+        matrix = np.lib.format.open_memmap(tmp_matrix_path, mode='w+', dtype=np.float32, shape=(total, dimensions))
+        metadata = []
+
+        for row, chunk in enumerate(queryset.iterator(chunk_size=500)):
+            if row >= total:
+                break
+            vector = np.asarray(chunk.embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            # Filas normalizadas: el producto punto ya es la similitud coseno
+            matrix[row] = vector / norm if norm else vector
+            metadata.append({
+                'id': chunk.id,
+                'content': chunk.content,
+                'source_file': chunk.source_file,
+                'course': chunk.course,
+                'module': chunk.module,
+                'chunk_index': chunk.chunk_index,
+                'simhash': chunk.simhash,
+                'duplicate_sources': chunk.duplicate_sources,
+            })
+            # Huella por contenido: bulk_update no actualiza updated_at (auto_now)
+            fingerprint.update(json.dumps(metadata[-1], sort_keys=True, ensure_ascii=False).encode())
+            fingerprint.update(vector.tobytes())
+
+        matrix.flush()
+        del matrix
+        if len(metadata) < total:
+            self._trim_matrix(tmp_matrix_path, len(metadata), dimensions)
+
+        generation = fingerprint.hexdigest()[:16]
+        matrix_path, metadata_path = self._paths(generation)
+        if matrix_path.exists() and metadata_path.exists():
+            # Misma generación ya publicada: puede estar mapeada por un lector (en Windows no se puede reemplazar)
+            tmp_matrix_path.unlink(missing_ok=True)
+        else:
+            os.replace(tmp_matrix_path, matrix_path)
+            metadata_path.write_text(json.dumps(metadata, ensure_ascii=False), encoding='utf-8')
+
+        # Publicación atómica: los lectores ven la generación anterior o la nueva, nunca una a medias
+        current_tmp = self.snapshot_dir / f'CURRENT.tmp{uuid.uuid4().hex}'
+        current_tmp.write_text(generation, encoding='utf-8')
+        os.replace(current_tmp, self.snapshot_dir / 'CURRENT')
+
+        self._prune({generation, previous})
+
+        print(f"✅ Snapshot vectorial {generation}: {len(metadata)} chunks")
+        return generation
+
+    def request_rebuild(self):
+        """Reconstruye el snapshot en segundo plano (ediciones desde el admin)
+
+        Las peticiones que llegan durante una reconstrucción se agrupan en una sola más.
+        """
+        with self._build_lock:
+            self._rebuild_pending = True
+            if self._builder is None:
+                self._builder = threading.Thread(target=self._rebuild_loop, name='vector-snapshot', daemon=True)
+                self._builder.start()
+
+    def _rebuild_loop(self):
+        from django.db import connection
+
+        try:
+            while True:
+                with self._build_lock:
+                    if not self._rebuild_pending:
+                        self._builder = None
+                        return
+                    self._rebuild_pending = False
+                try:
+                    self.build_snapshot()
+                except Exception as e:
+                    print(f"❌ Error reconstruyendo el snapshot vectorial: {e}")
+        finally:
+            # Hilo propio: su conexión a la base de datos no la cierra nadie más
+            connection.close()
+
+    def _trim_matrix(self, path: Path, rows: int, dimensions: int):
+        """Recorta la matriz a las filas escritas
+
+        Si se borran chunks durante el volcado, el iterador devuelve menos filas que el
+        count() inicial y las sobrantes quedarían a cero, desalineadas con los metadatos.
+        """
+        trimmed_path = path.with_name(f'embeddings.trim{uuid.uuid4().hex}.npy')
+        source = np.load(path, mmap_mode='r')
+        trimmed = np.lib.format.open_memmap(trimmed_path, mode='w+', dtype=np.float32, shape=(rows, dimensions))
+        trimmed[:] = source[:rows]
+        trimmed.flush()
+        del trimmed, source
+        os.replace(trimmed_path, path)
+
+    def _prune(self, keep: set):
+        """Borra las generaciones anteriores a la previa
+
+        La previa se conserva: otros procesos pueden tenerla mapeada o haber leído CURRENT
+        justo antes de la publicación. En Windows un archivo mapeado no se puede borrar;
+        se reintenta en el próximo snapshot.
+        """
+        for path in self.snapshot_dir.glob('*-*.*'):
+            if path.name.split('-', 1)[1].split('.', 1)[0] in keep:
+                continue
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                print(f"⚠️ No se pudo borrar {path.name} (en uso), se reintentará: {e}")
+
+    def _maybe_reload(self):
+        """Recarga el snapshot si CURRENT apunta a otra generación (llamar con el lock tomado)"""
+        now = time.monotonic()
+        if self._matrix is not None and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        try:
+            generation = (self.snapshot_dir / 'CURRENT').read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            return
+        if generation == self._generation:
+            return
+
+        matrix_path, metadata_path = self._paths(generation)
+        try:
+            matrix = np.load(matrix_path, mmap_mode='r')
+            metadata = json.loads(metadata_path.read_text(encoding='utf-8'))
+        except FileNotFoundError as e:
+            print(f"⚠️ Snapshot vectorial {generation} incompleto, se reintentará: {e}")
+            return
+        if matrix.shape[0] != len(metadata):
+            # La búsqueda indexa los metadatos con las filas de la matriz: se mantiene la generación actual
+            print(f"⚠️ Snapshot vectorial {generation} inconsistente: {matrix.shape[0]} filas, {len(metadata)} metadatos")
+            return
+        self._matrix = matrix
+        self._metadata = metadata
+        self._courses = np.array([item['course'] for item in self._metadata])
+        self._generation = generation
+        print(f"🔄 Snapshot vectorial cargado: {generation} ({len(self._metadata)} chunks)")
+
+    def search(self, query_embedding: List[float], limit: int, courses: List[str] | None = None) -> List[Dict]:
+        """Top-k por similitud coseno con un único producto matriz-vector"""
+        from .models import ChatbotKnowledgeChunk
+
+        with self._lock:
+            self._maybe_reload()
+            matrix, chunk_courses, metadata = self._matrix, self._courses, self._metadata
+
+        if matrix is None or not len(metadata):
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = matrix @ query
+        if courses:
+            scores = np.where(np.isin(chunk_courses, courses), scores, -np.inf)
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        course_names = dict(ChatbotKnowledgeChunk.COURSE_CHOICES)
+        results = []
+        for i in top:
+            similarity = float(scores[i])
+            if similarity == -np.inf:
+                continue
+            item = metadata[i]
+            results.append({
+                **item,
+                'course': course_names.get(item['course'], item['course']),
+                'distance': 1 - similarity,
+                'similarity': similarity,
+            })
+        return results
+
+
+memory_index = MemoryVectorIndex()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:12
+
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0003_chatbotknowledgechunk'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatbotknowledgechunk',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='chatbot_chunk_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
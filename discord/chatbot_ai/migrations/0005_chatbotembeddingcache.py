@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:05
+
+import django.utils.timezone
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0004_chatbotknowledgechunk_hnsw_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatbotEmbeddingCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(help_text='SHA-256 de (texto normalizado, modelo, dimensiones)', max_length=64, unique=True)),
+                ('embedding', pgvector.django.vector.VectorField(help_text='Vector embedding de OpenAI')),
+                ('embedding_model', models.CharField(help_text='Modelo de embeddings usado', max_length=100)),
+                ('dimensions', models.IntegerField(help_text='Dimensiones del embedding')),
+                ('hit_count', models.IntegerField(default=0, help_text='Veces que se reutilizó')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='Último uso (para expiración)')),
+            ],
+            options={
+                'verbose_name': 'Cache de Embedding',
+                'verbose_name_plural': 'Cache de Embeddings',
+                'ordering': ['-last_used_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:48
+
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0005_chatbotembeddingcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatbotAnswerCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.TextField(help_text='Pregunta original')),
+                ('query_embedding', pgvector.django.vector.VectorField(dimensions=1536, help_text='Embedding de la pregunta')),
+                ('answer', models.TextField(help_text='Respuesta generada por la IA')),
+                ('tokens_used', models.IntegerField(default=0, help_text='Tokens consumidos al generarla')),
+                ('hit_count', models.IntegerField(default=0, help_text='Veces que se reutilizó')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Respuesta Cacheada',
+                'verbose_name_plural': 'Respuestas Cacheadas',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0006_chatbotanswercache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatbotknowledgechunk',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('content', config='spanish'), name='chatbot_chunk_content_fts'),
+        ),
+    ]
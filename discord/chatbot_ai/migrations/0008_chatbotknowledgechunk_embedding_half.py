@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:20
+
+import pgvector.django.halfvec
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0007_chatbotknowledgechunk_content_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbotknowledgechunk',
+            name='embedding_half',
+            field=pgvector.django.halfvec.HalfVectorField(blank=True, dimensions=1536, help_text='Copia half-precision para la búsqueda de candidatos', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='chatbotknowledgechunk',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding_half'], m=16, name='chatbot_chunk_emb_half_hnsw', opclasses=['halfvec_cosine_ops']),
+        ),
+    ]
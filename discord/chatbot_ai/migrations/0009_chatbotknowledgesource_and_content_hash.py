@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0008_chatbotknowledgechunk_embedding_half'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbotknowledgechunk',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 del contenido (reindexado incremental)', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ChatbotKnowledgeSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course', models.CharField(choices=[('imax_launch', 'IMAX Launch'), ('imax_pro', 'IMAX Pro')], max_length=20)),
+                ('source_file', models.CharField(help_text='Archivo de origen', max_length=255)),
+                ('content_hash', models.CharField(help_text='SHA-256 del archivo al indexarlo', max_length=64)),
+                ('chunk_count', models.IntegerField(default=0, help_text='Chunks generados')),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Fuente de Conocimiento',
+                'verbose_name_plural': 'Fuentes de Conocimiento',
+                'ordering': ['course', 'source_file'],
+                'unique_together': {('course', 'source_file')},
+            },
+        ),
+    ]
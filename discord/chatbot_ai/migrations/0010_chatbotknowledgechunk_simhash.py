@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0009_chatbotknowledgesource_and_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbotknowledgechunk',
+            name='simhash',
+            field=models.BigIntegerField(blank=True, help_text='Huella SimHash de 64 bits (detección de casi-duplicados)', null=True),
+        ),
+        migrations.AddField(
+            model_name='chatbotknowledgechunk',
+            name='duplicate_sources',
+            field=models.JSONField(blank=True, default=list, help_text='Otros archivos con un chunk casi idéntico fusionado en este'),
+        ),
+    ]
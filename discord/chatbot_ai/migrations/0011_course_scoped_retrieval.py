@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:10
+
+import django.db.models
+import pgvector.django.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0010_chatbotknowledgechunk_simhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbotrole',
+            name='allowed_courses',
+            field=models.JSONField(blank=True, default=list, help_text='Cursos que puede consultar el RAG, p. ej. ["imax_launch"] (vacío = todos)'),
+        ),
+        migrations.AddField(
+            model_name='chatbotanswercache',
+            name='course_scope',
+            field=models.CharField(blank=True, db_index=True, help_text='Cursos consultados al generarla (vacío = todos)', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='chatbotknowledgechunk',
+            index=pgvector.django.indexes.HnswIndex(condition=django.db.models.Q(('course', 'imax_launch')), ef_construction=64, fields=['embedding'], m=16, name='chatbot_chunk_imax_launch_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='chatbotknowledgechunk',
+            index=pgvector.django.indexes.HnswIndex(condition=django.db.models.Q(('course', 'imax_pro')), ef_construction=64, fields=['embedding'], m=16, name='chatbot_chunk_imax_pro_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0011_course_scoped_retrieval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatbotCacheGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Cache al que corresponde (p. ej. prompt)', max_length=50, unique=True)),
+                ('generation', models.PositiveBigIntegerField(default=0, help_text='Se incrementa en cada cambio')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Generación de Cache',
+                'verbose_name_plural': 'Generaciones de Cache',
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:30
+
+import django.db.models
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0012_chatbotcachegeneration'),
+    ]
+
+    operations = [
+        # Todos los chunks necesitan embedding_half: pasa a ser la única columna con índice ANN
+        migrations.RunSQL(
+            sql="UPDATE chatbot_ai_chatbotknowledgechunk SET embedding_half = embedding::halfvec(1536) WHERE embedding_half IS NULL",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RemoveIndex(
+            model_name='chatbotknowledgechunk',
+            name='chatbot_chunk_embedding_hnsw',
+        ),
+        migrations.RemoveIndex(
+            model_name='chatbotknowledgechunk',
+            name='chatbot_chunk_imax_launch_hnsw',
+        ),
+        migrations.RemoveIndex(
+            model_name='chatbotknowledgechunk',
+            name='chatbot_chunk_imax_pro_hnsw',
+        ),
+        migrations.AddIndex(
+            model_name='chatbotknowledgechunk',
+            index=pgvector.django.indexes.HnswIndex(condition=django.db.models.Q(('course', 'imax_launch')), ef_construction=64, fields=['embedding_half'], m=16, name='chatbot_chunk_half_launch_hnsw', opclasses=['halfvec_cosine_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='chatbotknowledgechunk',
+            index=pgvector.django.indexes.HnswIndex(condition=django.db.models.Q(('course', 'imax_pro')), ef_construction=64, fields=['embedding_half'], m=16, name='chatbot_chunk_half_pro_hnsw', opclasses=['halfvec_cosine_ops']),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_ai', '0013_halfvec_only_ann_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='chatbotknowledgechunk',
+            name='chatbot_chunk_content_fts',
+        ),
+        migrations.AddIndex(
+            model_name='chatbotknowledgechunk',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('content', 'module', 'source_file', config='spanish'), name='chatbot_chunk_text_fts'),
+        ),
+    ]
@@ -1,9 +1,11 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import datetime, timedelta
 import json
-from pgvector.django import VectorField
+from pgvector.django import VectorField, HalfVectorField, HnswIndex
 
 class ChatbotConfiguration(models.Model):
     """Configuración del chatbot de IA"""
@@ -32,6 +34,7 @@ class ChatbotRole(models.Model):
     monthly_limit = models.IntegerField(default=300, help_text="Límite mensual de mensajes")
     max_context_messages = models.IntegerField(default=20, help_text="Máximo de mensajes en contexto")
     priority = models.IntegerField(default=1, help_text="Prioridad (mayor = mejor)")
+    allowed_courses = models.JSONField(default=list, blank=True, help_text="Cursos que puede consultar el RAG, p. ej. [\"imax_launch\"] (vacío = todos)")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -144,6 +147,12 @@ class ChatbotTraining(models.Model):
         verbose_name_plural = "Entrenamientos Chatbot"
 
 
+# Parámetros de construcción HNSW: las migraciones usan los mismos literales y
+# rebuild_hnsw_indexes / build_prefix_index los toman por defecto
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+
+
 class ChatbotKnowledgeChunk(models.Model):
     """Chunks de conocimiento vectorizados para RAG"""
     
@@ -154,11 +163,15 @@ class ChatbotKnowledgeChunk(models.Model):
     
     content = models.TextField(help_text="Contenido del chunk (~500 tokens)")
     embedding = VectorField(dimensions=1536, help_text="Vector embedding de OpenAI")
+    embedding_half = HalfVectorField(dimensions=1536, null=True, blank=True, help_text="Copia half-precision para la búsqueda de candidatos")
     source_file = models.CharField(max_length=255, help_text="Archivo de origen")
     course = models.CharField(max_length=20, choices=COURSE_CHOICES, db_index=True)
     module = models.CharField(max_length=100, blank=True, help_text="Módulo extraído del nombre")
     chunk_index = models.IntegerField(default=0, help_text="Índice del chunk en el archivo")
     token_count = models.IntegerField(default=0, help_text="Número de tokens en el chunk")
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text="SHA-256 del contenido (reindexado incremental)")
+    simhash = models.BigIntegerField(null=True, blank=True, help_text="Huella SimHash de 64 bits (detección de casi-duplicados)")
+    duplicate_sources = models.JSONField(default=list, blank=True, help_text="Otros archivos con un chunk casi idéntico fusionado en este")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -171,4 +184,109 @@ class ChatbotKnowledgeChunk(models.Model):
         verbose_name_plural = "Chunks de Conocimiento"
         indexes = [
             models.Index(fields=['course', 'source_file']),
-        ]
\ No newline at end of file
+            # m / ef_construction fijos (HNSW_M, HNSW_EF_CONSTRUCTION) para que las migraciones no dependan
+            # del entorno; para ajustarlos en un despliegue: manage.py rebuild_hnsw_indexes --m ... --ef-construction ...
+            # Solo la copia half-precision tiene índice ANN (la mitad de memoria);
+            # `embedding` float32 se usa únicamente para re-ordenar los candidatos
+            HnswIndex(
+                name='chatbot_chunk_emb_half_hnsw',
+                fields=['embedding_half'],
+                m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                opclasses=['halfvec_cosine_ops'],
+            ),
+            # Índices parciales por curso: una búsqueda filtrada por un curso recorre solo su parte
+            HnswIndex(
+                name='chatbot_chunk_half_launch_hnsw',
+                fields=['embedding_half'],
+                m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                opclasses=['halfvec_cosine_ops'],
+                condition=models.Q(course='imax_launch'),
+            ),
+            HnswIndex(
+                name='chatbot_chunk_half_pro_hnsw',
+                fields=['embedding_half'],
+                m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                opclasses=['halfvec_cosine_ops'],
+                condition=models.Q(course='imax_pro'),
+            ),
+            # Full-text para la búsqueda híbrida (ver vector_service.CHUNK_TSVECTOR_SQL)
+            GinIndex(SearchVector('content', 'module', 'source_file', config='spanish'), name='chatbot_chunk_text_fts'),
+        ]
+
+
+class ChatbotKnowledgeSource(models.Model):
+    """Archivo de entrenamiento indexado (para reindexar solo lo que cambió)"""
+    
+    course = models.CharField(max_length=20, choices=ChatbotKnowledgeChunk.COURSE_CHOICES)
+    source_file = models.CharField(max_length=255, help_text="Archivo de origen")
+    content_hash = models.CharField(max_length=64, help_text="SHA-256 del archivo al indexarlo")
+    chunk_count = models.IntegerField(default=0, help_text="Chunks generados")
+    indexed_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.course} - {self.source_file} ({self.chunk_count} chunks)"
+    
+    class Meta:
+        ordering = ['course', 'source_file']
+        unique_together = ['course', 'source_file']
+        verbose_name = "Fuente de Conocimiento"
+        verbose_name_plural = "Fuentes de Conocimiento"
+
+
+class ChatbotEmbeddingCache(models.Model):
+    """Cache persistente de embeddings de consultas"""
+    
+    cache_key = models.CharField(max_length=64, unique=True, help_text="SHA-256 de (texto normalizado, modelo, dimensiones)")
+    embedding = VectorField(help_text="Vector embedding de OpenAI")
+    embedding_model = models.CharField(max_length=100, help_text="Modelo de embeddings usado")
+    dimensions = models.IntegerField(help_text="Dimensiones del embedding")
+    hit_count = models.IntegerField(default=0, help_text="Veces que se reutilizó")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True, help_text="Último uso (para expiración)")
+    
+    def __str__(self):
+        return f"{self.embedding_model} ({self.dimensions}) - {self.cache_key[:12]}... ({self.hit_count} hits)"
+    
+    class Meta:
+        ordering = ['-last_used_at']
+        verbose_name = "Cache de Embedding"
+        verbose_name_plural = "Cache de Embeddings"
+
+
+
+class ChatbotAnswerCache(models.Model):
+    """Respuestas reutilizables para preguntas casi idénticas"""
+    
+    question = models.TextField(help_text="Pregunta original")
+    query_embedding = VectorField(dimensions=1536, help_text="Embedding de la pregunta")
+    answer = models.TextField(help_text="Respuesta generada por la IA")
+    tokens_used = models.IntegerField(default=0, help_text="Tokens consumidos al generarla")
+    course_scope = models.CharField(max_length=255, blank=True, db_index=True, help_text="Cursos consultados al generarla (vacío = todos)")
+    hit_count = models.IntegerField(default=0, help_text="Veces que se reutilizó")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.question[:50]}... ({self.hit_count} hits)"
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Respuesta Cacheada"
+        verbose_name_plural = "Respuestas Cacheadas"
+
+
+class ChatbotCacheGeneration(models.Model):
+    """Contador de versión compartido entre procesos (bot y Django) para invalidar caches en memoria"""
+    
+    name = models.CharField(max_length=50, unique=True, help_text="Cache al que corresponde (p. ej. prompt)")
+    generation = models.PositiveBigIntegerField(default=0, help_text="Se incrementa en cada cambio")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} (gen {self.generation})"
+    
+    class Meta:
+        verbose_name = "Generación de Cache"
+        verbose_name_plural = "Generaciones de Cache"
@@ -0,0 +1,163 @@
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+from typing import List
+from aiohttp import web
+
+
+def hashed_embedding(text: str, dimensions: int = 1536) -> List[float]:
+    """Embedding determinista (bag-of-words con hashing): textos con palabras en común son similares"""
+    vector = [0.0] * dimensions
+    for word in re.findall(r'\w+', text.lower()):
+        digest = hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        sign = 1.0 if value & 1 else -1.0
+        vector[(value >> 1) % dimensions] += sign
+
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm:
+        vector = [x / norm for x in vector]
+    return vector
+
+
+def _count_tokens(text: str) -> int:
+    """Aproximación barata de tokens (suficiente para simular `usage`)"""
+    return max(1, len(text) // 4)
+
+
+class OpenAIStub:
+    """Servidor local compatible con /v1/embeddings y /v1/chat/completions para pruebas y benchmarks"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: int | None = None
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.stats = {'embeddings': 0, 'chat_completions': 0, 'errors': 0, 'rate_limited': 0}
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/v1/embeddings', self.embeddings)
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_get('/v1/stats', self.get_stats)
+        return app
+
+    async def _simulate(self) -> web.Response | None:
+        """Aplica latencia y, según las tasas configuradas, devuelve un 429 o un 500"""
+        delay = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            self.stats['rate_limited'] += 1
+            return web.json_response(
+                {'error': {'message': 'Rate limit reached (stub)', 'type': 'rate_limit_exceeded'}},
+                status=429,
+                headers={'Retry-After': str(self.retry_after)},
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats['errors'] += 1
+            return web.json_response(
+                {'error': {'message': 'Internal error (stub)', 'type': 'server_error'}},
+                status=500,
+            )
+        return None
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        failure = await self._simulate()
+        if failure:
+            return failure
+
+        body = await request.json()
+        inputs = body.get('input', '')
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = int(body.get('dimensions') or 1536)
+
+        self.stats['embeddings'] += len(inputs)
+        tokens = sum(_count_tokens(text) for text in inputs)
+        return web.json_response({
+            'object': 'list',
+            'model': body.get('model', 'text-embedding-3-small'),
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': hashed_embedding(text, dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        })
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        failure = await self._simulate()
+        if failure:
+            return failure
+
+        body = await request.json()
+        messages = body.get('messages', [])
+        question = next((m['content'] for m in reversed(messages) if m.get('role') == 'user'), '')
+        content = f"Respuesta simulada (stub local): {' '.join(question.split()[-30:])}"
+
+        prompt_tokens = sum(_count_tokens(m.get('content', '')) for m in messages)
+        completion_tokens = _count_tokens(content)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+        completion_id = f"chatcmpl-stub-{int(time.time() * 1000)}"
+        model = body.get('model', 'gpt-4o-mini')
+        self.stats['chat_completions'] += 1
+
+        if not body.get('stream'):
+            return web.json_response({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+
+        async def send(payload: dict):
+            await response.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+        def chunk(delta: dict, finish_reason: str | None = None) -> dict:
+            return {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+
+        await send(chunk({'role': 'assistant', 'content': ''}))
+        for word in re.findall(r'\S+\s*', content):
+            await send(chunk({'content': word}))
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000 / 20)
+        await send(chunk({}, 'stop'))
+
+        if (body.get('stream_options') or {}).get('include_usage'):
+            await send({'id': completion_id, 'object': 'chat.completion.chunk', 'model': model, 'choices': [], 'usage': usage})
+
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
@@ -0,0 +1,142 @@
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Tuple
+from .db_reads import db_read
+from .chunking import get_tokenizer
+from .generations import get_generation, bump_generation
+
+
+PROMPT_GENERATION = 'prompt'
+DEFAULT_MODEL = 'gpt-4o-mini'
+PROMPT_CONFIG_NAMES = ('system_prompt', 'openai_model', 'rag_context_max_tokens')
+# Se cargan en la misma consulta pero no cambian la respuesta (no forman parte de la versión)
+SEARCH_CONFIG_NAMES = ('rag_hnsw_ef_search',)
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """System prompt listo para enviar (prompt base + entrenamientos activos en orden de prioridad)
+    y los parámetros de la conversación que se configuran junto a él"""
+
+    system_prompt: str
+    model: str
+    trainings: Tuple[str, ...]
+    tokens: int
+    version: str
+    generation: int
+    rag_context_max_tokens: int | None = None
+    rag_hnsw_ef_search: int | None = None
+
+
+class PromptRegistry:
+    """Mantiene en memoria el prompt compilado y lo recompila solo cuando cambia
+
+    Las señales de ChatbotConfiguration, ChatbotTraining y BotConfiguration incrementan
+    la generación 'prompt' en la base de datos; cada proceso la revisa como mucho cada
+    `check_interval` segundos. `max_age` fuerza una recompilación por si algún cambio
+    no pasó por las señales (p. ej. un UPDATE manual).
+    """
+
+    def __init__(self):
+        self.check_interval = 5.0
+        self.max_age = 600.0
+        self._lock = threading.Lock()
+        self._compiled: CompiledPrompt | None = None
+        self._checked_at = 0.0
+        self._compiled_at = 0.0
+
+    async def get(self, default_system_prompt: str) -> CompiledPrompt:
+        """Prompt compilado vigente (sin consultas mientras no haya cambios)"""
+        compiled = self._compiled
+        if compiled and time.monotonic() - self._checked_at < self.check_interval:
+            return compiled
+
+        try:
+            return await db_read(self._refresh)(default_system_prompt)
+        except Exception as e:
+            print(f"⚠️ Error compilando el prompt del sistema: {e}")
+            return self._compiled or self._build(default_system_prompt, DEFAULT_MODEL, [], -1)
+
+    def peek(self) -> CompiledPrompt | None:
+        """Prompt compilado actual sin revisar la generación (código síncrono de búsqueda)"""
+        return self._compiled
+
+    def invalidate(self):
+        """Descarta el prompt compilado en este proceso y en los demás"""
+        bump_generation(PROMPT_GENERATION)
+        self._checked_at = 0.0
+
+    def _refresh(self, default_system_prompt: str) -> CompiledPrompt:
+        with self._lock:
+            now = time.monotonic()
+            if self._compiled and now - self._checked_at < self.check_interval:
+                return self._compiled
+
+            # La generación se lee antes que los datos: si cambian entre medias, se recompila en la próxima revisión
+            generation = get_generation(PROMPT_GENERATION)
+            if self._compiled and self._compiled.generation == generation and now - self._compiled_at < self.max_age:
+                self._checked_at = now
+                return self._compiled
+
+            self._compiled = self._compile(default_system_prompt, generation)
+            self._checked_at = self._compiled_at = now
+            return self._compiled
+
+    def _compile(self, default_system_prompt: str, generation: int) -> CompiledPrompt:
+        from invitation_roles.models import BotConfiguration
+        from .models import ChatbotConfiguration, ChatbotTraining
+
+        names = PROMPT_CONFIG_NAMES + SEARCH_CONFIG_NAMES
+        # ChatbotConfiguration tiene prioridad sobre BotConfiguration
+        values = dict(BotConfiguration.objects.filter(name__in=names, is_active=True).values_list('name', 'value'))
+        values.update(ChatbotConfiguration.objects.filter(name__in=names, is_active=True).values_list('name', 'value'))
+
+        trainings = list(
+            ChatbotTraining.objects.filter(is_active=True).order_by('-priority', 'id').values_list('name', 'content')
+        )
+        compiled = self._build(
+            values.get('system_prompt') or default_system_prompt,
+            values.get('openai_model') or DEFAULT_MODEL,
+            trainings,
+            generation,
+            self._to_int(values.get('rag_context_max_tokens')),
+            self._to_int(values.get('rag_hnsw_ef_search')),
+        )
+        print(f"🧩 Prompt compilado v{compiled.version}: {compiled.tokens} tokens, {len(trainings)} entrenamientos")
+        return compiled
+
+    def _to_int(self, value: str | None) -> int | None:
+        value = (value or '').strip()
+        return int(value) if value.isdigit() else None
+
+    def _build(
+        self,
+        base_prompt: str,
+        model: str,
+        trainings: list,
+        generation: int,
+        rag_context_max_tokens: int | None = None,
+        rag_hnsw_ef_search: int | None = None
+    ) -> CompiledPrompt:
+        system_prompt = base_prompt
+        if trainings:
+            system_prompt += "\n\n## Reglas Adicionales:\n"
+            for name, content in trainings:
+                system_prompt += f"\n### {name}\n{content}\n"
+
+        return CompiledPrompt(
+            system_prompt=system_prompt,
+            model=model,
+            trainings=tuple(name for name, _ in trainings),
+            tokens=len(get_tokenizer().encode(system_prompt)),
+            # El presupuesto de contexto también cambia la respuesta (separa entradas del cache de respuestas)
+            version=hashlib.sha256(f"{model}\n{rag_context_max_tokens}\n{system_prompt}".encode('utf-8')).hexdigest()[:12],
+            generation=generation,
+            rag_context_max_tokens=rag_context_max_tokens,
+            rag_hnsw_ef_search=rag_hnsw_ef_search,
+        )
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,87 @@
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Dict
+from .db_reads import db_read
+from .generations import get_generation, bump_generation
+from .models import ChatbotRole
+
+
+ROLES_GENERATION = 'roles'
+
+
+@dataclass(frozen=True)
+class RoleSnapshot:
+    """ChatbotRole activos indexados por role_id de Discord, en orden de prioridad"""
+
+    roles: Dict[str, ChatbotRole] = field(default_factory=dict)
+    ids: frozenset = frozenset()
+    generation: int = -1
+
+
+class RoleRegistry:
+    """Copia en memoria de los ChatbotRole activos
+
+    Igual que prompt_registry: las señales de ChatbotRole incrementan la generación
+    'roles' y cada proceso la revisa como mucho cada `check_interval` segundos.
+    """
+
+    def __init__(self):
+        self.check_interval = 5.0
+        self.max_age = 600.0
+        self._lock = threading.Lock()
+        self._snapshot: RoleSnapshot | None = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+
+    async def snapshot(self) -> RoleSnapshot:
+        snapshot = self._snapshot
+        if snapshot and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+
+        try:
+            return await db_read(self._refresh)()
+        except Exception as e:
+            print(f"⚠️ Error cargando roles del chatbot: {e}")
+            return self._snapshot or RoleSnapshot()
+
+    async def get(self, role_id: str) -> ChatbotRole | None:
+        """ChatbotRole activo con ese role_id (None si no existe)"""
+        return (await self.snapshot()).roles.get(str(role_id))
+
+    async def resolve(self, member_roles: Dict[str, int]) -> ChatbotRole | None:
+        """Mejor ChatbotRole entre los roles de un miembro ({role_id: posición en Discord})
+
+        Gana la mayor prioridad; a igual prioridad, el rol más alto en la jerarquía de Discord.
+        """
+        snapshot = await self.snapshot()
+        matched = snapshot.ids.intersection(member_roles)
+        if not matched:
+            return None
+        best = max(matched, key=lambda role_id: (snapshot.roles[role_id].priority, member_roles[role_id]))
+        return snapshot.roles[best]
+
+    def invalidate(self):
+        """Descarta la copia en este proceso y en los demás"""
+        bump_generation(ROLES_GENERATION)
+        self._checked_at = 0.0
+
+    def _refresh(self) -> RoleSnapshot:
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot and now - self._checked_at < self.check_interval:
+                return self._snapshot
+
+            generation = get_generation(ROLES_GENERATION)
+            if self._snapshot and self._snapshot.generation == generation and now - self._loaded_at < self.max_age:
+                self._checked_at = now
+                return self._snapshot
+
+            roles = list(ChatbotRole.objects.filter(is_active=True).order_by('-priority', 'id'))
+            by_id = {role.role_id: role for role in roles}
+            self._snapshot = RoleSnapshot(roles=by_id, ids=frozenset(by_id), generation=generation)
+            self._checked_at = self._loaded_at = now
+            return self._snapshot
+
+
+role_registry = RoleRegistry()
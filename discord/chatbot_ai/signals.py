@@ -0,0 +1,48 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from invitation_roles.models import BotConfiguration
+from .models import ChatbotConfiguration, ChatbotTraining, ChatbotRole
+from .answer_cache import invalidate_answer_cache
+from .prompt_registry import prompt_registry, PROMPT_CONFIG_NAMES
+from .role_registry import role_registry
+
+
+@receiver([post_save, post_delete], sender=ChatbotConfiguration)
+@receiver([post_save, post_delete], sender=ChatbotTraining)
+def invalidate_answers_on_change(sender, **kwargs):
+    """Las respuestas cacheadas dependen del prompt y los entrenamientos.
+
+    Los chunks de conocimiento no usan señales (se escriben en masa al indexar);
+    index_training_data y el admin invalidan explícitamente.
+    """
+    try:
+        invalidate_answer_cache()
+    except Exception as e:
+        print(f"Error invalidando cache de respuestas: {e}")
+
+
+@receiver([post_save, post_delete], sender=BotConfiguration)
+def invalidate_answers_on_prompt_config_change(sender, instance, **kwargs):
+    """system_prompt y openai_model de BotConfiguration son el respaldo del prompt compilado"""
+    if instance.name in PROMPT_CONFIG_NAMES:
+        invalidate_answers_on_change(sender, **kwargs)
+
+
+@receiver([post_save, post_delete], sender=ChatbotConfiguration)
+@receiver([post_save, post_delete], sender=ChatbotTraining)
+@receiver([post_save, post_delete], sender=BotConfiguration)
+def invalidate_prompt_on_change(sender, **kwargs):
+    """El prompt compilado incluye system_prompt, openai_model y los entrenamientos activos"""
+    try:
+        prompt_registry.invalidate()
+    except Exception as e:
+        print(f"Error invalidando prompt compilado: {e}")
+
+
+@receiver([post_save, post_delete], sender=ChatbotRole)
+def invalidate_roles_on_change(sender, **kwargs):
+    """Resolución de roles, cursos permitidos y límites salen de la copia en memoria"""
+    try:
+        role_registry.invalidate()
+    except Exception as e:
+        print(f"Error invalidando roles del chatbot: {e}")
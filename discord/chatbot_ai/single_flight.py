@@ -0,0 +1,77 @@
+import asyncio
+from typing import Dict, Callable, Awaitable, Any, Tuple
+
+
+class _Flight:
+    """Una ejecución en curso y quienes esperan su resultado"""
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.latest = ""
+        self.subscribers = []
+        self.waiters = 0
+
+    async def publish(self, text: str):
+        """Reenvía la respuesta parcial a todos los suscriptores"""
+        self.latest = text
+        for callback in list(self.subscribers):
+            try:
+                await callback(text)
+            except Exception as e:
+                print(f"⚠️ Error enviando respuesta parcial compartida: {e}")
+
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes con la misma clave en una sola ejecución
+
+    La ejecución corre en su propia tarea: si quien la inició se cancela, los
+    demás siguen esperando el mismo resultado.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.stats = {'leaders': 0, 'followers': 0}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[Callable[[str], Awaitable[None]]], Awaitable[Any]],
+        on_partial: Callable[[str], Awaitable[None]] | None = None
+    ) -> Tuple[Any, bool]:
+        """Ejecuta factory(publish) o se une a la ejecución en curso con la misma clave
+
+        Returns:
+            Tuple[Any, bool]: (resultado, compartido) — compartido es True para quien se unió
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(factory(flight.publish))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.stats['leaders'] += 1
+        else:
+            self.stats['followers'] += 1
+
+        if on_partial:
+            flight.subscribers.append(on_partial)
+            if flight.latest:
+                await on_partial(flight.latest)
+
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            if on_partial in flight.subscribers:
+                flight.subscribers.remove(on_partial)
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+single_flight = SingleFlight()
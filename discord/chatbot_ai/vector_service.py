@@ -1,18 +1,87 @@
 import os
+import json
+import time
 import aiohttp
 import asyncio
+import numpy as np
 from typing import List, Dict, Tuple
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.expressions import RawSQL
+from pgvector import HalfVector
 from pgvector.django import CosineDistance
+from .chunking import hamming_distance
+from .embedding_cache import embedding_cache
+from .http_client import openai_http, openai_url, OpenAIAPIError
+from .prompt_registry import prompt_registry
+from .generations import get_generation
+
+
+# ChatbotCacheGeneration donde build_prefix_index registra las dimensiones del índice construido
+PREFIX_INDEX_GENERATION = 'prefix_index_dimensions'
+
+
+# Debe coincidir con la expresión del índice GIN chatbot_chunk_text_fts (SearchVector de Django):
+# los códigos de módulo ("M2.3", "DIA 4") están en module / source_file, no en la transcripción
+CHUNK_TSVECTOR_SQL = (
+    "to_tsvector('spanish'::regconfig, "
+    "COALESCE(content, '') || ' ' || COALESCE(module, '') || ' ' || COALESCE(source_file, ''))"
+)
+
+# Reciprocal Rank Fusion: cada lista aporta 1 / (k + posición)
+HYBRID_SEARCH_SQL = """
+WITH vector_hits AS (
+    SELECT id, ROW_NUMBER() OVER (ORDER BY distance) AS rank
+    FROM (
+        SELECT id, embedding_half <=> %(embedding)s::halfvec AS distance
+        FROM {table}
+        WHERE TRUE {course_filter}
+        ORDER BY distance
+        LIMIT %(candidates)s
+    ) AS nearest
+),
+lexical_hits AS (
+    SELECT id, ROW_NUMBER() OVER (ORDER BY text_rank DESC) AS rank
+    FROM (
+        SELECT id, ts_rank_cd({tsvector}, tsquery) AS text_rank
+        -- Términos unidos con OR: una pregunta completa casi nunca contiene todos sus términos
+        -- en un mismo chunk; ts_rank_cd premia a los que contienen más
+        FROM {table}, replace(plainto_tsquery('spanish', %(query)s)::text, '&', '|')::tsquery AS tsquery
+        WHERE {tsvector} @@ tsquery {course_filter}
+        ORDER BY text_rank DESC
+        LIMIT %(candidates)s
+    ) AS matches
+)
+SELECT c.id, c.content, c.source_file, c.course, c.module, c.chunk_index, c.simhash, c.duplicate_sources,
+       c.embedding <=> %(embedding)s::vector AS distance,
+       COALESCE(1.0 / (%(rrf_k)s + v.rank), 0) + COALESCE(1.0 / (%(rrf_k)s + l.rank), 0) AS score
+FROM vector_hits v
+FULL OUTER JOIN lexical_hits l ON l.id = v.id
+JOIN {table} c ON c.id = COALESCE(v.id, l.id)
+ORDER BY score DESC
+LIMIT %(limit)s
+"""
 
 
 class VectorService:
     """Servicio para embeddings y búsqueda vectorial"""
     
+    BACKENDS = ('pgvector', 'hybrid', 'memory', 'exact', 'halfvec', 'prefix')
+    
     def __init__(self):
         self.embedding_model = "text-embedding-3-small"
         self.embedding_dimensions = 1536
         self.timeout = 30
+        self.ef_search = settings.CHATBOT_HNSW_EF_SEARCH
+        self.hybrid_candidates_factor = 4
+        self.rrf_k = 60
+        self.rerank_candidates_factor = settings.CHATBOT_RERANK_CANDIDATES_FACTOR
+        self.dedup_max_distance = settings.CHATBOT_DEDUP_MAX_DISTANCE
+        self.dedup_extra_candidates = 3
+        self.prefix_dimensions = settings.CHATBOT_EMBEDDING_PREFIX_DIMENSIONS
+        self.prefix_check_interval = 60.0
+        self._built_prefix_dimensions: int | None = None
+        self._prefix_checked_at = 0.0
     
     def _get_api_key(self) -> str:
         """Obtiene la API key de OpenAI desde variables de entorno"""
@@ -21,8 +90,23 @@ class VectorService:
             raise ValueError("OPENAI_API_KEY no configurada en variables de entorno")
         return api_key
     
+    def _get_ef_search(self, limit: int) -> int:
+        """hnsw.ef_search (nunca menor que el límite pedido)
+
+        `rag_hnsw_ef_search` de ChatbotConfiguration se lee del prompt compilado en memoria,
+        sin consultas por búsqueda; si no está configurado, CHATBOT_HNSW_EF_SEARCH.
+        """
+        compiled = prompt_registry.peek()
+        ef_search = compiled.rag_hnsw_ef_search if compiled and compiled.rag_hnsw_ef_search else self.ef_search
+        return max(ef_search, limit)
+    
     async def create_embedding(self, text: str) -> List[float]:
-        """Crea un embedding para un texto usando OpenAI"""
+        """Crea un embedding para un texto usando OpenAI (con cache de consultas)"""
+        cache_key = embedding_cache.make_key(text, self.embedding_model, self.embedding_dimensions)
+        cached = await embedding_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         api_key = self._get_api_key()
         
         headers = {
@@ -33,22 +117,24 @@ class VectorService:
         data = {
             "model": self.embedding_model,
             "input": text,
+            "dimensions": self.embedding_dimensions,
             "encoding_format": "float"
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.openai.com/v1/embeddings",
-                headers=headers,
-                json=data,
-                timeout=aiohttp.ClientTimeout(total=self.timeout)
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result['data'][0]['embedding']
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"OpenAI Embeddings API error {response.status}: {error_text}")
+        session = await openai_http.get_session()
+        async with session.post(
+            openai_url('embeddings'),
+            headers=headers,
+            json=data,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        ) as response:
+            if response.status == 200:
+                result = await response.json()
+                embedding = result['data'][0]['embedding']
+                await embedding_cache.set(cache_key, embedding, self.embedding_model, self.embedding_dimensions)
+                return embedding
+            else:
+                raise await OpenAIAPIError.from_response(response, 'OpenAI Embeddings API error')
     
     async def create_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
         """Crea embeddings para múltiples textos en batch"""
@@ -62,83 +148,302 @@ class VectorService:
         data = {
             "model": self.embedding_model,
             "input": texts,
+            "dimensions": self.embedding_dimensions,
             "encoding_format": "float"
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.openai.com/v1/embeddings",
-                headers=headers,
-                json=data,
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    sorted_data = sorted(result['data'], key=lambda x: x['index'])
-                    return [item['embedding'] for item in sorted_data]
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"OpenAI Embeddings API error {response.status}: {error_text}")
+        session = await openai_http.get_session()
+        async with session.post(
+            openai_url('embeddings'),
+            headers=headers,
+            json=data,
+            timeout=aiohttp.ClientTimeout(total=60)
+        ) as response:
+            if response.status == 200:
+                result = await response.json()
+                sorted_data = sorted(result['data'], key=lambda x: x['index'])
+                return [item['embedding'] for item in sorted_data]
+            else:
+                raise await OpenAIAPIError.from_response(response, 'OpenAI Embeddings API error')
     
     async def search_similar_chunks(
         self, 
         query: str, 
         limit: int = 5,
-        course_filter: str | None = None
+        course_filter: str | List[str] | None = None,
+        backend: str | None = None
     ) -> List[Dict]:
-        """Busca los chunks más similares a una consulta"""
-        from .models import ChatbotKnowledgeChunk
-        from django.db import OperationalError, ProgrammingError
+        """Busca los chunks más similares a una consulta
+        
+        course_filter: un curso o una lista de cursos (p. ej. los permitidos al rol del usuario).
         
+        backend: 'pgvector' (solo vectorial), 'hybrid' (léxico + vectorial con RRF)
+        o 'memory' (snapshot NumPy en proceso). Por defecto settings.CHATBOT_RAG_BACKEND.
+        También se aceptan 'exact', 'halfvec' y 'prefix' para forzar una
+        estrategia concreta (los usa benchmark_rag).
+        """
         try:
             query_embedding = await self.create_embedding(query)
-            
-            def search_db():
-                try:
-                    queryset = ChatbotKnowledgeChunk.objects.all()
-                    
-                    if course_filter:
-                        queryset = queryset.filter(course=course_filter)
-                    
-                    results = queryset.annotate(
-                        distance=CosineDistance('embedding', query_embedding)
-                    ).order_by('distance')[:limit]
-                    
-                    return [
-                        {
-                            'content': chunk.content,
-                            'source_file': chunk.source_file,
-                            'course': chunk.get_course_display(),
-                            'module': chunk.module,
-                            'distance': chunk.distance,
-                            'similarity': 1 - chunk.distance
-                        }
-                        for chunk in results
-                    ]
-                except (OperationalError, ProgrammingError) as e:
-                    if 'no existe la relación' in str(e) or 'does not exist' in str(e) or 'vector' in str(e).lower():
-                        return []
-                    raise
-            
-            return await sync_to_async(search_db)()
+            return await self.search_by_embedding(query, query_embedding, limit, course_filter, backend)
         except Exception as e:
             if 'no existe la relación' in str(e) or 'does not exist' in str(e) or 'vector' in str(e).lower():
                 return []
             raise
     
-    def format_context_for_llm(self, chunks: List[Dict]) -> str:
-        """Formatea los chunks encontrados como contexto para el LLM"""
+    async def search_by_embedding(
+        self,
+        query: str,
+        query_embedding: List[float],
+        limit: int = 5,
+        course_filter: str | List[str] | None = None,
+        backend: str | None = None,
+        strict: bool = False
+    ) -> List[Dict]:
+        """Ejecuta la búsqueda con un embedding ya calculado en el backend indicado
+        
+        Se piden unos candidatos de más para poder descartar hits casi idénticos
+        (misma huella SimHash) sin quedarse por debajo de `limit`. Con strict=True
+        (benchmark) un backend desconocido o un error de base de datos se propagan
+        en vez de devolver una lista vacía.
+        """
+        from django.db import OperationalError, ProgrammingError
+        
+        backend = backend or settings.CHATBOT_RAG_BACKEND
+        if strict and backend not in self.BACKENDS:
+            raise ValueError(f"Backend de búsqueda desconocido: {backend}")
+        courses = self._normalize_courses(course_filter)
+        fetch_limit = limit + self.dedup_extra_candidates if self.dedup_max_distance >= 0 else limit
+        
+        if backend == 'memory':
+            from .memory_index import memory_index
+            # Fuera del event loop: una recarga del snapshot (np.load + metadatos) tarda lo suyo
+            results = await sync_to_async(memory_index.search, thread_sensitive=False)(query_embedding, fetch_limit, courses)
+            if strict and memory_index._matrix is None:
+                raise RuntimeError("No hay snapshot vectorial: ejecuta build_vector_snapshot")
+            return self._drop_near_duplicates(results, limit)
+        
+        def search_db():
+            try:
+                if backend == 'hybrid':
+                    return self._search_hybrid(query, query_embedding, fetch_limit, courses)
+                if backend == 'exact':
+                    return self._search_exact(query_embedding, fetch_limit, courses)
+                if backend in ('halfvec', 'prefix'):
+                    return self._search_pgvector(query_embedding, fetch_limit, courses, first_pass=backend)
+                return self._search_pgvector(query_embedding, fetch_limit, courses)
+            except (OperationalError, ProgrammingError) as e:
+                if strict:
+                    raise
+                if 'no existe la relación' in str(e) or 'does not exist' in str(e) or 'vector' in str(e).lower():
+                    return []
+                raise
+        
+        return self._drop_near_duplicates(await sync_to_async(search_db)(), limit)
+    
+    def _normalize_courses(self, course_filter: str | List[str] | None) -> List[str] | None:
+        """Lista ordenada de cursos a consultar, o None si no hay que filtrar (todos los cursos)"""
+        from .models import ChatbotKnowledgeChunk
+        
+        if not course_filter:
+            return None
+        courses = sorted({course_filter} if isinstance(course_filter, str) else set(course_filter))
+        if {key for key, _ in ChatbotKnowledgeChunk.COURSE_CHOICES} <= set(courses):
+            return None
+        return courses
+    
+    def _filter_courses(self, queryset, courses: List[str] | None):
+        """Un solo curso se filtra con igualdad para que el planner use su índice HNSW parcial"""
+        if not courses:
+            return queryset
+        if len(courses) == 1:
+            return queryset.filter(course=courses[0])
+        return queryset.filter(course__in=courses)
+    
+    def _drop_near_duplicates(self, chunks: List[Dict], limit: int) -> List[Dict]:
+        """Descarta hits casi idénticos a otro mejor posicionado y recorta a `limit`"""
+        if self.dedup_max_distance < 0:
+            return chunks[:limit]
+        
+        kept = []
+        for chunk in chunks:
+            if not any(self._is_near_duplicate(chunk, other) for other in kept):
+                kept.append(chunk)
+                if len(kept) == limit:
+                    break
+        return kept
+    
+    def _is_near_duplicate(self, a: Dict, b: Dict) -> bool:
+        if a.get('simhash') is None or b.get('simhash') is None:
+            return a['content'] == b['content']
+        return hamming_distance(a['simhash'], b['simhash']) <= self.dedup_max_distance
+    
+    def _set_ef_search(self, cursor, limit: int):
+        """Aplica hnsw.ef_search solo a la transacción actual (SET LOCAL)"""
+        cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(self._get_ef_search(limit))])
+    
+    def _search_pgvector(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        courses: List[str] | None,
+        first_pass: str | None = None
+    ) -> List[Dict]:
+        """Búsqueda por distancia coseno en dos pasos
+        
+        first_pass='halfvec' (por defecto) busca candidatos con el índice HNSW de la copia
+        half-precision, el único índice ANN; 'prefix' con el de las primeras N dimensiones
+        (Matryoshka). En ambos casos se re-ordenan solo esos candidatos con el embedding completo.
+        """
+        from .models import ChatbotKnowledgeChunk
+        from django.db import connection, transaction
+        
+        first_pass = first_pass or settings.CHATBOT_VECTOR_FIRST_PASS
+        queryset = self._filter_courses(ChatbotKnowledgeChunk.objects.all(), courses)
+        
+        prefix_dims = self._get_prefix_dimensions() if first_pass == 'prefix' else None
+        if first_pass == 'prefix' and not prefix_dims:
+            print("⚠️ No hay índice de prefijo (build_prefix_index): primera pasada con halfvec")
+        
+        if prefix_dims:
+            order = CosineDistance(self._prefix_expression(prefix_dims), query_embedding[:prefix_dims])
+        else:
+            order = CosineDistance('embedding_half', HalfVector(query_embedding))
+        
+        # Los ids se materializan antes del re-ranking: como subconsulta, el planner podía
+        # resolver el ORDER BY final con otro índice HNSW + filtro por id y devolver menos filas
+        candidates = limit * self.rerank_candidates_factor
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                self._set_ef_search(cursor, candidates)
+            candidate_ids = list(queryset.order_by(order).values_list('id', flat=True)[:candidates])
+        
+        chunks = list(ChatbotKnowledgeChunk.objects.filter(id__in=candidate_ids).defer('embedding_half'))
+        return self._rerank(chunks, query_embedding, limit)
+    
+    def _rerank(self, chunks: list, query_embedding: List[float], limit: int) -> List[Dict]:
+        """Ordena los candidatos por similitud coseno con el embedding float32 completo (en Python)"""
         if not chunks:
-            return ""
+            return []
+        
+        matrix = np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        similarities = (matrix @ query) / np.where(norms == 0, 1, norms)
+        
+        results = []
+        for i in np.argsort(-similarities)[:limit]:
+            chunks[i].distance = float(1 - similarities[i])
+            results.append(self._serialize_chunk(chunks[i]))
+        return results
+    
+    def _get_prefix_dimensions(self) -> int | None:
+        """Dimensiones con las que build_prefix_index construyó el índice (None si no hay)
+
+        Se usa la dimensión registrada y no CHATBOT_EMBEDDING_PREFIX_DIMENSIONS: si no
+        coinciden, la expresión de la consulta no casa con el índice y Postgres recorre
+        la tabla entera sin avisar. Se revisa como mucho cada `prefix_check_interval` segundos.
+        """
+        now = time.monotonic()
+        if now - self._prefix_checked_at >= self.prefix_check_interval:
+            built = get_generation(PREFIX_INDEX_GENERATION) or None
+            if built and built != self.prefix_dimensions and built != self._built_prefix_dimensions:
+                print(f"⚠️ Índice de prefijo construido con {built} dimensiones "
+                      f"(CHATBOT_EMBEDDING_PREFIX_DIMENSIONS={self.prefix_dimensions}); se usa {built}")
+            self._built_prefix_dimensions = built
+            self._prefix_checked_at = now
+        return self._built_prefix_dimensions
+    
+    def _prefix_expression(self, dims: int) -> RawSQL:
+        """Prefijo del embedding; debe coincidir con el índice creado por build_prefix_index"""
+        dims = int(dims)
+        return RawSQL(f"subvector(embedding, 1, {dims})::vector({dims})", [])
+    
+    def _search_exact(self, query_embedding: List[float], limit: int, courses: List[str] | None) -> List[Dict]:
+        """Búsqueda exacta (scan secuencial, sin índice ANN): referencia para medir recall"""
+        from .models import ChatbotKnowledgeChunk
+        from django.db import connection, transaction
         
-        context_parts = []
+        queryset = self._filter_courses(ChatbotKnowledgeChunk.objects.all(), courses)
         
-        for i, chunk in enumerate(chunks, 1):
-            context_parts.append(
-                f"[{chunk['course']} - {chunk['module']}]\n{chunk['content']}"
-            )
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+            
+            results = list(queryset.annotate(
+                distance=CosineDistance('embedding', query_embedding)
+            ).order_by('distance')[:limit])
+        
+        return [self._serialize_chunk(chunk) for chunk in results]
+    
+    def _serialize_chunk(self, chunk) -> Dict:
+        """Convierte un chunk anotado con `distance` en el dict que consume el RAG"""
+        return {
+            'id': chunk.id,
+            'content': chunk.content,
+            'source_file': chunk.source_file,
+            'course': chunk.get_course_display(),
+            'module': chunk.module,
+            'chunk_index': chunk.chunk_index,
+            'simhash': chunk.simhash,
+            'duplicate_sources': chunk.duplicate_sources,
+            'distance': chunk.distance,
+            'similarity': 1 - chunk.distance
+        }
+    
+    def _search_hybrid(self, query: str, query_embedding: List[float], limit: int, courses: List[str] | None) -> List[Dict]:
+        """Búsqueda híbrida: full-text (GIN) + coseno (HNSW halfvec) fusionados con RRF en una sola consulta"""
+        from .models import ChatbotKnowledgeChunk
+        from django.db import connection, transaction
+        
+        course_sql = ""
+        if courses:
+            course_sql = "AND course = %(course)s" if len(courses) == 1 else "AND course = ANY(%(courses)s)"
+        sql = HYBRID_SEARCH_SQL.format(
+            table=ChatbotKnowledgeChunk._meta.db_table,
+            tsvector=CHUNK_TSVECTOR_SQL,
+            course_filter=course_sql,
+        )
+        candidates = max(limit * self.hybrid_candidates_factor, limit)
+        params = {
+            'embedding': '[' + ','.join(str(float(x)) for x in query_embedding) + ']',
+            'query': query,
+            'course': courses[0] if courses else None,
+            'courses': courses,
+            'candidates': candidates,
+            'rrf_k': self.rrf_k,
+            'limit': limit,
+        }
+        
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                self._set_ef_search(cursor, candidates)
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+        
+        course_names = dict(ChatbotKnowledgeChunk.COURSE_CHOICES)
+        return [
+            {
+                'id': chunk_id,
+                'content': content,
+                'source_file': source_file,
+                'course': course_names.get(course, course),
+                'module': module,
+                'chunk_index': chunk_index,
+                'simhash': fingerprint,
+                # Django registra jsonb para devolver texto: JSONField lo decodifica, un cursor crudo no
+                'duplicate_sources': json.loads(duplicates) if isinstance(duplicates, str) else (duplicates or []),
+                'distance': distance,
+                'similarity': 1 - distance,
+                'score': float(score),
+            }
+            for chunk_id, content, source_file, course, module, chunk_index, fingerprint, duplicates, distance, score in rows
+        ]
+    
+    def format_context_for_llm(self, chunks: List[Dict], max_tokens: int | None = None) -> str:
+        """Formatea los chunks encontrados como contexto para el LLM (ver ContextBuilder)"""
+        from .context_builder import context_builder
         
-        return "\n\n".join(context_parts)
+        return context_builder.build(chunks, max_tokens)
 
 
 vector_service = VectorService()
@@ -133,3 +133,59 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Configuración del bot (BotConfiguration): copia en memoria por proceso; el bot la recarga
+# al recibir NOTIFY del trigger de la tabla y, como respaldo, cada BOT_CONFIG_CACHE_TTL segundos
+BOT_CONFIG_CACHE_TTL = float(os.environ.get('BOT_CONFIG_CACHE_TTL', '30'))
+
+
+# Chatbot IA / RAG
+# ef_search de cada consulta si no hay `rag_hnsw_ef_search` en ChatbotConfiguration
+# (más alto = más recall, más lento; nunca menor que los chunks pedidos)
+
+CHATBOT_HNSW_EF_SEARCH = int(os.environ.get('CHATBOT_HNSW_EF_SEARCH', '40'))
+
+# Backend de búsqueda RAG: 'pgvector' (solo vectorial), 'hybrid' (full-text + vectorial con RRF)
+# o 'memory' (NumPy sobre el snapshot de CHATBOT_VECTOR_SNAPSHOT_DIR)
+CHATBOT_RAG_BACKEND = os.environ.get('CHATBOT_RAG_BACKEND', 'pgvector')
+CHATBOT_VECTOR_SNAPSHOT_DIR = os.environ.get('CHATBOT_VECTOR_SNAPSHOT_DIR', str(BASE_DIR / 'vector_snapshot'))
+
+# Primera pasada de la búsqueda pgvector: 'halfvec' (único índice ANN, half-precision) o 'prefix'
+# (primeras N dimensiones, las del índice de build_prefix_index; por defecto se construye con
+# CHATBOT_EMBEDDING_PREFIX_DIMENSIONS); ambas
+# re-ordenan CHATBOT_RERANK_CANDIDATES_FACTOR * límite candidatos con el vector float32 completo
+CHATBOT_VECTOR_FIRST_PASS = os.environ.get('CHATBOT_VECTOR_FIRST_PASS', 'halfvec')
+CHATBOT_RERANK_CANDIDATES_FACTOR = int(os.environ.get('CHATBOT_RERANK_CANDIDATES_FACTOR', '4'))
+CHATBOT_EMBEDDING_PREFIX_DIMENSIONS = int(os.environ.get('CHATBOT_EMBEDDING_PREFIX_DIMENSIONS', '256'))
+
+# Cache de embeddings de consultas (LRU en memoria + tabla ChatbotEmbeddingCache)
+CHATBOT_EMBEDDING_CACHE_MEMORY_SIZE = int(os.environ.get('CHATBOT_EMBEDDING_CACHE_MEMORY_SIZE', '1000'))
+CHATBOT_EMBEDDING_CACHE_DB_SIZE = int(os.environ.get('CHATBOT_EMBEDDING_CACHE_DB_SIZE', '50000'))
+CHATBOT_EMBEDDING_CACHE_MAX_AGE_DAYS = int(os.environ.get('CHATBOT_EMBEDDING_CACHE_MAX_AGE_DAYS', '30'))
+
+# Conexiones simultáneas máximas del pool HTTP compartido hacia OpenAI
+CHATBOT_HTTP_POOL_LIMIT = int(os.environ.get('CHATBOT_HTTP_POOL_LIMIT', '20'))
+
+# Hilos (y por tanto conexiones a Postgres) para las lecturas en paralelo del bot: historial, prompt, roles
+CHATBOT_DB_READ_THREADS = int(os.environ.get('CHATBOT_DB_READ_THREADS', '4'))
+
+# Presupuesto de la API de embeddings durante la indexación (límites de la cuenta de OpenAI)
+CHATBOT_EMBEDDING_CONCURRENCY = int(os.environ.get('CHATBOT_EMBEDDING_CONCURRENCY', '4'))
+CHATBOT_EMBEDDING_TPM = int(os.environ.get('CHATBOT_EMBEDDING_TPM', '1000000'))
+CHATBOT_EMBEDDING_RPM = int(os.environ.get('CHATBOT_EMBEDDING_RPM', '3000'))
+
+# Respuestas en streaming: el mensaje de Discord se edita con la respuesta parcial,
+# como mucho una vez cada CHATBOT_STREAM_EDIT_INTERVAL segundos (límite de ediciones de Discord)
+CHATBOT_STREAMING_ENABLED = os.environ.get('CHATBOT_STREAMING_ENABLED', 'True').lower() == 'true'
+CHATBOT_STREAM_EDIT_INTERVAL = float(os.environ.get('CHATBOT_STREAM_EDIT_INTERVAL', '1.2'))
+
+# Casi-duplicados: distancia de Hamming máxima entre huellas SimHash de 64 bits (-1 desactiva)
+CHATBOT_DEDUP_MAX_DISTANCE = int(os.environ.get('CHATBOT_DEDUP_MAX_DISTANCE', '6'))
+
+# Cache semántico de respuestas (reutiliza respuestas de preguntas casi idénticas). Con
+# CHATBOT_ANSWER_CACHE_MAX_HISTORY > 0 las respuestas con historial solo se reutilizan con el mismo historial
+CHATBOT_ANSWER_CACHE_ENABLED = os.environ.get('CHATBOT_ANSWER_CACHE_ENABLED', 'True').lower() == 'true'
+CHATBOT_ANSWER_CACHE_SIMILARITY = float(os.environ.get('CHATBOT_ANSWER_CACHE_SIMILARITY', '0.95'))
+CHATBOT_ANSWER_CACHE_MAX_HISTORY = int(os.environ.get('CHATBOT_ANSWER_CACHE_MAX_HISTORY', '0'))
+CHATBOT_ANSWER_CACHE_TTL_HOURS = int(os.environ.get('CHATBOT_ANSWER_CACHE_TTL_HOURS', '168'))
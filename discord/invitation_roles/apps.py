@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class InvitationRolesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invitation_roles'
+
+    def ready(self):
+        from . import signals  # noqa: F401
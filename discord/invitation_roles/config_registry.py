@@ -0,0 +1,119 @@
+import time
+import asyncio
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+NOTIFY_CHANNEL = 'bot_configuration_changed'
+
+
+class BotConfigRegistry:
+    """Copia en memoria de las BotConfiguration activas, compartida por el bot, las vistas y los cogs
+
+    Se carga entera con una sola consulta y se recarga cuando llega un NOTIFY del trigger
+    de la tabla (listen(), solo en el proceso del bot), cuando una señal local avisa de
+    un cambio o, como respaldo, cada `ttl` segundos.
+    """
+
+    def __init__(self):
+        self.ttl = settings.BOT_CONFIG_CACHE_TTL
+        self.reconnect_delay = 5
+        self._lock = threading.Lock()
+        self._values: dict[str, str] = {}
+        self._loaded_at = 0.0
+        # Cada invalidate() lo incrementa; una recarga que empezó antes no se da por fresca
+        self._generation = 0
+        self._listener: asyncio.Task | None = None
+
+    def _is_fresh(self) -> bool:
+        return bool(self._loaded_at) and time.monotonic() - self._loaded_at < self.ttl
+
+    def reload(self):
+        """Lee todas las configuraciones activas (síncrono: llamar fuera del event loop)"""
+        from .models import BotConfiguration
+
+        generation = self._generation
+        values = dict(BotConfiguration.objects.filter(is_active=True).values_list('name', 'value'))
+        with self._lock:
+            self._values = values
+            # Si llegó un invalidate() durante la consulta, los valores pueden ser anteriores al cambio
+            if generation == self._generation:
+                self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """La próxima lectura recarga desde la base de datos"""
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = 0.0
+
+    def get(self, name, default=None):
+        """Valor de una configuración (vistas de Django y código síncrono)"""
+        if not self._is_fresh():
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Error al cargar configuraciones del bot: {e}")
+        return self._values.get(name, default)
+
+    async def aget(self, name, default=None):
+        """Valor de una configuración desde código async (bot y cogs)"""
+        if not self._is_fresh():
+            try:
+                await sync_to_async(self.reload)()
+            except Exception as e:
+                print(f"Error al cargar configuraciones del bot: {e}")
+        return self._values.get(name, default)
+
+    def peek(self, name, default=None):
+        """Valor de la copia actual sin recargar nunca (rutas calientes que no pueden hacer I/O)"""
+        return self._values.get(name, default)
+
+    def get_int(self, name, default=None):
+        return self._to_int(name, self.get(name, default), default)
+
+    async def aget_int(self, name, default=None):
+        return self._to_int(name, await self.aget(name, default), default)
+
+    def _to_int(self, name, value, default):
+        try:
+            return int(value) if value else default
+        except (ValueError, TypeError):
+            print(f"Error al convertir configuración '{name}' a entero: {value}")
+            return default
+
+    def start_listener(self):
+        """Lanza listen() en el event loop actual (idempotente; on_ready puede dispararse varias veces)"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self.listen())
+
+    async def listen(self):
+        """Escucha NOTIFY en una conexión dedicada e invalida la copia en cada cambio; reconecta si se cae"""
+        import psycopg
+
+        db = settings.DATABASES['default']
+        while True:
+            try:
+                conn = await psycopg.AsyncConnection.connect(
+                    dbname=db['NAME'],
+                    user=db['USER'],
+                    password=db['PASSWORD'],
+                    host=db['HOST'],
+                    port=db['PORT'],
+                    autocommit=True,
+                )
+                async with conn:
+                    await conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    # Pudo haber cambios mientras no se escuchaba
+                    self.invalidate()
+                    print("👂 Escuchando cambios de configuración del bot (LISTEN/NOTIFY)")
+                    async for _ in conn.notifies():
+                        self.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Listener de configuración desconectado, reintentando en {self.reconnect_delay}s: {e}")
+            await asyncio.sleep(self.reconnect_delay)
+
+
+config_registry = BotConfigRegistry()
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitation_roles', '0008_sharedinvitelink_sharedinviteredemption'),
+    ]
+
+    operations = [
+        # Avisa a los procesos que escuchan (config_registry.listen) de cualquier cambio en la tabla
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION invitation_roles_botconfiguration_notify() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('bot_configuration_changed', TG_OP);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER invitation_roles_botconfiguration_notify
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON invitation_roles_botconfiguration
+                FOR EACH STATEMENT EXECUTE FUNCTION invitation_roles_botconfiguration_notify();
+            """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS invitation_roles_botconfiguration_notify ON invitation_roles_botconfiguration;
+                DROP FUNCTION IF EXISTS invitation_roles_botconfiguration_notify();
+            """,
+        ),
+    ]
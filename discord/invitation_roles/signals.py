@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import BotConfiguration
+from .config_registry import config_registry
+
+
+@receiver([post_save, post_delete], sender=BotConfiguration)
+def invalidate_config_on_change(sender, **kwargs):
+    """Los cambios hechos en este proceso se ven al instante; el resto se entera por NOTIFY o por TTL"""
+    config_registry.invalidate()
@@ -2,7 +2,8 @@ from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from django.db import transaction
-from .models import Invite, BotConfiguration, HotmartProduct, HotmartSubscription, HotmartTransaction, SharedInviteLink, SharedInviteRedemption
+from .config_registry import config_registry
+from .models import Invite, HotmartProduct, HotmartSubscription, HotmartTransaction, SharedInviteLink, SharedInviteRedemption
 from datetime import datetime, timedelta
 import os
 import json
@@ -19,26 +20,14 @@ def get_bot_config(name, default=None):
     Obtiene una configuración del bot desde la base de datos.
     Si no existe o no está activa, devuelve el valor por defecto.
     """
-    try:
-        config = BotConfiguration.objects.filter(name=name, is_active=True).first()
-        if config:
-            return config.value
-        return default
-    except Exception as e:
-        print(f"Error al obtener configuración '{name}': {e}")
-        return default
+    return config_registry.get(name, default)
 
 
 def get_bot_config_int(name, default=None):
     """
     Obtiene una configuración del bot como entero.
     """
-    value = get_bot_config(name, default)
-    try:
-        return int(value) if value else default
-    except (ValueError, TypeError):
-        print(f"Error al convertir configuración '{name}' a entero: {value}")
-        return default
+    return config_registry.get_int(name, default)
 
 
 def _require_api_key(request):
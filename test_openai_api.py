@@ -12,8 +12,10 @@ async def test_openai_api():
         print("❌ ERROR: OPENAI_API_KEY no está configurada en .env")
         return False
     
+    base_url = os.environ.get('OPENAI_API_BASE', 'https://api.openai.com/v1').rstrip('/')
+    
     print(f"✅ API Key encontrada: {api_key[:10]}...{api_key[-4:]}")
-    print("🔄 Probando conexión con OpenAI API...\n")
+    print(f"🔄 Probando conexión con OpenAI API ({base_url})...\n")
     
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -32,7 +34,7 @@ async def test_openai_api():
     try:
         async with aiohttp.ClientSession() as session:
             async with session.post(
-                "https://api.openai.com/v1/chat/completions",
+                f"{base_url}/chat/completions",
                 headers=headers,
                 json=data,
                 timeout=aiohttp.ClientTimeout(total=30)
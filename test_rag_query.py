@@ -20,6 +20,8 @@ load_dotenv()
 
 from chatbot_ai.vector_service import vector_service
 from chatbot_ai.ai_service import ai_service
+from chatbot_ai.embedding_cache import embedding_cache
+from chatbot_ai.http_client import openai_http
 
 async def test_rag_query():
     print("=" * 70)
@@ -48,6 +50,7 @@ async def test_rag_query():
             return
         
         print(f"✅ Se encontraron {len(chunks)} chunks relevantes:")
+        print(f"   Cache de embeddings: {embedding_cache.get_stats()}")
         print()
         
         for i, chunk in enumerate(chunks, 1):
@@ -93,6 +96,8 @@ async def test_rag_query():
         print(f"❌ Error: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        await openai_http.close()
 
 if __name__ == "__main__":
     asyncio.run(test_rag_query())